@@ -1,58 +1,1755 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context, session, g
 from werkzeug.utils import secure_filename
 import os
 import anthropic
 from pptx import Presentation
 import PyPDF2
+import numpy as np
 import json
+import csv
+import click
+import sqlite3
+import zlib
+import difflib
+import re
+import sys
+import hashlib
+import uuid
+import threading
+import time
+import asyncio
+import random
+import itertools
+import weakref
+from collections import OrderedDict, defaultdict, deque
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-this'
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['ALLOWED_EXTENSIONS'] = {'pdf', 'pptx'}
+app.config['LLM_MAX_WORKERS'] = int(os.environ.get('LLM_MAX_WORKERS', 8))
+app.config['LLM_CACHE_SIZE'] = int(os.environ.get('LLM_CACHE_SIZE', 256))
+app.config['LLM_CACHE_DIR'] = os.environ.get('LLM_CACHE_DIR')  # unset = memory only
+app.config['TASK_MAX_WORKERS'] = int(os.environ.get('TASK_MAX_WORKERS', 4))
+app.config['TASK_RESULT_TTL'] = int(os.environ.get('TASK_RESULT_TTL', 3600))
+app.config['PARSE_PARALLEL_MIN_PAGES'] = int(os.environ.get('PARSE_PARALLEL_MIN_PAGES', 40))
+app.config['PARSE_WORKERS'] = int(os.environ.get('PARSE_WORKERS', os.cpu_count() or 2))
+app.config['PROFILE_CHUNK_TOKENS'] = int(os.environ.get('PROFILE_CHUNK_TOKENS', 8000))
+app.config['PROFILE_CHUNK_CONCURRENCY'] = int(os.environ.get('PROFILE_CHUNK_CONCURRENCY', 4))
+app.config['MATCH_MODE'] = os.environ.get('MATCH_MODE', 'llm')  # local, llm or hybrid
+app.config['MATCH_REFINE_TOP'] = int(os.environ.get('MATCH_REFINE_TOP', 3))
+app.config['MATCH_REFINE_MIN_SCORE'] = int(os.environ.get('MATCH_REFINE_MIN_SCORE', 75))
+app.config['BATCH_SCORE_CONCURRENCY'] = int(os.environ.get('BATCH_SCORE_CONCURRENCY', 4))
+app.config['DATABASE'] = os.environ.get('DATABASE', 'cv_ai.db')
+app.config['SESSION_IDLE_TTL'] = int(os.environ.get('SESSION_IDLE_TTL', 7 * 24 * 3600))
+app.config['SESSION_CACHE_SIZE'] = int(os.environ.get('SESSION_CACHE_SIZE', 256))
+app.config['CV_SNAPSHOT_INTERVAL'] = int(os.environ.get('CV_SNAPSHOT_INTERVAL', 10))
+app.config['BLOB_DIR'] = os.environ.get('BLOB_DIR', 'blobs')
+app.config['RECOMMENDATIONS_TTL'] = int(os.environ.get('RECOMMENDATIONS_TTL', 6 * 3600))
+app.config['JOBS_PAGE_SIZE'] = int(os.environ.get('JOBS_PAGE_SIZE', 100))
+app.config['JOB_IMPORT_BATCH_SIZE'] = int(os.environ.get('JOB_IMPORT_BATCH_SIZE', 500))
+app.config['SERVING_MODE'] = os.environ.get('SERVING_MODE', 'sync')  # sync or async
+app.config['LLM_MAX_INFLIGHT'] = int(os.environ.get('LLM_MAX_INFLIGHT', 256))
+app.config['LLM_RETRY_BASE_DELAY'] = float(os.environ.get('LLM_RETRY_BASE_DELAY', 0.5))
+app.config['LLM_RETRY_MAX_DELAY'] = float(os.environ.get('LLM_RETRY_MAX_DELAY', 8))
+app.config['CIRCUIT_FAILURE_THRESHOLD'] = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', 5))
+app.config['CIRCUIT_COOLDOWN'] = float(os.environ.get('CIRCUIT_COOLDOWN', 30))
+
+# Model, max_tokens and timeout per prompt function. A route with a fallback
+# gives the primary model latency_budget seconds before retrying on the fallback.
+# deadline bounds the whole call including retries; hedge_after sends a duplicate
+# request when the first has not answered within that many seconds. input_tokens
+# caps the documents, profile and CV text put into the prompt (not the instructions).
+LARGE_MODEL = "claude-opus-4-20250514"
+BALANCED_MODEL = "claude-sonnet-4-20250514"
+FAST_MODEL = "claude-3-5-haiku-20241022"
+DEFAULT_ROUTE = {'model': LARGE_MODEL, 'max_tokens': 1024, 'timeout': 60, 'fallback': None, 'latency_budget': None,
+                 'deadline': 120, 'retries': 3, 'hedge_after': None, 'input_tokens': 8000}
+DEFAULT_MODEL_ROUTES = {
+    'extract_cv_info': {'model': FAST_MODEL, 'max_tokens': 1500, 'timeout': 30, 'deadline': 60,
+                        'input_tokens': 6000},
+    'extract_profile': {'model': LARGE_MODEL, 'max_tokens': 2000, 'timeout': 90,
+                        'fallback': BALANCED_MODEL, 'latency_budget': 45, 'deadline': 180,
+                        'input_tokens': app.config['PROFILE_CHUNK_TOKENS']},
+    'generate_cv': {'model': LARGE_MODEL, 'max_tokens': 2500, 'timeout': 90,
+                    'fallback': BALANCED_MODEL, 'latency_budget': 45, 'deadline': 180, 'input_tokens': 6000},
+    'tailor_cv_to_job': {'model': LARGE_MODEL, 'max_tokens': 3000, 'timeout': 90,
+                         'fallback': BALANCED_MODEL, 'latency_budget': 45, 'deadline': 180, 'input_tokens': 6000},
+    'generate_cover_letter': {'model': LARGE_MODEL, 'max_tokens': 1500, 'timeout': 60,
+                              'fallback': BALANCED_MODEL, 'latency_budget': 30, 'deadline': 120,
+                              'input_tokens': 6000},
+    'analyze_job_match': {'model': FAST_MODEL, 'max_tokens': 800, 'timeout': 30, 'deadline': 45,
+                          'hedge_after': 6, 'input_tokens': 6000},
+    'search_recommended_jobs': {'model': BALANCED_MODEL, 'max_tokens': 2000, 'timeout': 60, 'deadline': 120,
+                                'input_tokens': 1500}
+}
+
+def _load_model_routes():
+    # e.g. MODEL_ROUTES='{"analyze_job_match": {"model": "claude-sonnet-4-20250514"}}'
+    routes = {name: dict(route) for name, route in DEFAULT_MODEL_ROUTES.items()}
+    for name, overrides in json.loads(os.environ.get('MODEL_ROUTES', '{}')).items():
+        routes[name] = {**routes.get(name, {}), **overrides}
+    return routes
+
+MODEL_ROUTES = _load_model_routes()
+app.config['MODEL_ROUTES'] = MODEL_ROUTES
 
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 #ADD API KEY HERE
-app_data = {
-    'cv_versions': [],
-    'current_cv_index': -1
-}
-saved_jobs = []
+
+def make_delta(old, new):
+    # Line-level diff: [start, end] copies lines from old, a string inserts new text
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    ops = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append(''.join(new_lines[j1:j2]))
+    return ops
+
+def apply_delta(old, ops):
+    old_lines = old.splitlines(keepends=True)
+    return ''.join(''.join(old_lines[op[0]:op[1]]) if isinstance(op, list) else op for op in ops)
+
+def pack(value):
+    return zlib.compress(json.dumps(value).encode('utf-8'))
+
+def unpack(data):
+    return json.loads(zlib.decompress(data).decode('utf-8'))
+
+def job_hash(job):
+    # The same posting modulo case and whitespace hashes the same
+    text = '\x1f'.join(' '.join((job.get(key) or '').casefold().split()) for key in ('title', 'company', 'description'))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]
+
+class BlobStore:
+    """Raw document text on disk, zlib-compressed and addressed by its SHA-256.
+
+    The same document uploaded twice, or by two users, is stored once.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def put(self, text):
+        data = text.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(zlib.compress(data))
+            os.replace(tmp_path, path)
+        return digest, len(data)
+
+    def get(self, digest):
+        try:
+            with open(self._path(digest), 'rb') as f:
+                return zlib.decompress(f.read()).decode('utf-8')
+        except FileNotFoundError:
+            return None
+
+    def size(self, digest):
+        try:
+            return os.path.getsize(self._path(digest))
+        except OSError:
+            return 0
+
+    def delete(self, digest):
+        try:
+            os.remove(self._path(digest))
+        except FileNotFoundError:
+            pass
+
+class Store:
+    """SQLite repository for CVs, versions, enhancements, jobs and task status.
+
+    The database runs in WAL mode so several worker processes can share it.
+    Each thread gets its own connection and every row is scoped by user_id.
+    Enhancement documents only keep a content hash; the text lives in `blobs`.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id TEXT PRIMARY KEY,
+        last_seen REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_users_last_seen ON users (last_seen);
+    CREATE TABLE IF NOT EXISTS state (
+        user_id TEXT NOT NULL,
+        key TEXT NOT NULL,
+        value TEXT NOT NULL,
+        PRIMARY KEY (user_id, key)
+    );
+    CREATE TABLE IF NOT EXISTS profiles (
+        user_id TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        version INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS cv_versions (
+        user_id TEXT NOT NULL,
+        version_number INTEGER NOT NULL,
+        description TEXT,
+        timestamp TEXT,
+        preview TEXT,
+        size INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        data BLOB NOT NULL,
+        PRIMARY KEY (user_id, version_number)
+    );
+    CREATE TABLE IF NOT EXISTS enhancements (
+        id TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        filename TEXT,
+        content_hash TEXT,
+        content_size INTEGER,
+        date_added TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_enhancements_user ON enhancements (user_id);
+    CREATE INDEX IF NOT EXISTS idx_enhancements_hash ON enhancements (content_hash);
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL,
+        title TEXT,
+        company TEXT,
+        description TEXT,
+        date_added TEXT,
+        applied INTEGER NOT NULL DEFAULT 0,
+        match_score INTEGER,
+        match_result TEXT,
+        scored_cv TEXT,
+        content_hash TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_user ON jobs (user_id, id);
+    CREATE INDEX IF NOT EXISTS idx_jobs_hash ON jobs (user_id, content_hash);
+    CREATE INDEX IF NOT EXISTS idx_jobs_score ON jobs (user_id, match_score);
+    CREATE TABLE IF NOT EXISTS job_terms (
+        user_id TEXT NOT NULL,
+        term TEXT NOT NULL,
+        job_id INTEGER NOT NULL,
+        PRIMARY KEY (user_id, term, job_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_job_terms_job ON job_terms (job_id);
+    CREATE TABLE IF NOT EXISTS tasks (
+        id TEXT PRIMARY KEY,
+        user_id TEXT,
+        data TEXT NOT NULL,
+        finished REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_tasks_finished ON tasks (finished);
+    """
+
+    JOB_FIELDS = ('title', 'company', 'description', 'date_added', 'applied',
+                  'match_score', 'match_result', 'scored_cv', 'content_hash')
+
+    USER_TABLES = ('users', 'state', 'profiles', 'cv_versions', 'enhancements', 'jobs', 'job_terms', 'tasks')
+
+    def __init__(self, path, blobs, idle_ttl=7 * 24 * 3600, cache_size=256, snapshot_interval=10):
+        self.path = path
+        self.blobs = blobs
+        self.idle_ttl = idle_ttl
+        self.cache_size = cache_size
+        self.snapshot_interval = max(1, snapshot_interval)
+        self.local = threading.local()
+        # Parsed MergedProfile per user, reused while the stored version is unchanged
+        self.profiles = OrderedDict()
+        self.seen = OrderedDict()
+        self.last_eviction = 0
+        self.lock = threading.Lock()
+        self._migrate()
+        self.db().executescript(self.SCHEMA)
+        # Jobs saved before the search index existed are indexed on the first search
+        self.reindex_pending = self.db().execute(
+            'SELECT 1 FROM jobs WHERE id NOT IN (SELECT job_id FROM job_terms) LIMIT 1').fetchone() is not None
+
+    def db(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.row_factory = sqlite3.Row
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self.local.db = db
+        return db
+
+    # Every schema change since the store was introduced is migrated in place, so
+    # existing databases never need recreating. Each step checks the live columns
+    # inside the lock, so workers starting together migrate once.
+    def _migrate(self):
+        db = self.db()
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            columns = self._columns(db, 'tasks')
+            if columns and 'user_id' not in columns:
+                # Tasks record their owner; older tasks have none and are visible to nobody
+                db.execute('ALTER TABLE tasks ADD COLUMN user_id TEXT')
+            if 'cv' in self._columns(db, 'cv_versions'):
+                # Full-text CV versions become snapshots and compressed diffs
+                db.execute('ALTER TABLE cv_versions ADD COLUMN preview TEXT')
+                db.execute('ALTER TABLE cv_versions ADD COLUMN size INTEGER NOT NULL DEFAULT 0')
+                db.execute("ALTER TABLE cv_versions ADD COLUMN kind TEXT NOT NULL DEFAULT 'snapshot'")
+                db.execute("ALTER TABLE cv_versions ADD COLUMN data BLOB NOT NULL DEFAULT x''")
+                previous = {}
+                rows = db.execute('SELECT user_id, version_number, cv FROM cv_versions '
+                                  'ORDER BY user_id, version_number').fetchall()
+                for row in rows:
+                    cv = row['cv']
+                    prior = previous.get(row['user_id'])
+                    if prior is None:
+                        kind, data = 'snapshot', pack(cv)
+                    else:
+                        kind, data = self._encode_cv(row['version_number'], cv, lambda: prior)
+                    db.execute('UPDATE cv_versions SET preview = ?, size = ?, kind = ?, data = ? '
+                               'WHERE user_id = ? AND version_number = ?',
+                               (cv[:400], len(cv), kind, data, row['user_id'], row['version_number']))
+                    previous[row['user_id']] = cv
+                db.execute('ALTER TABLE cv_versions DROP COLUMN cv')
+            if 'content' in self._columns(db, 'enhancements'):
+                # Raw enhancement text moves out of the row into the blob store
+                db.execute('ALTER TABLE enhancements ADD COLUMN content_hash TEXT')
+                db.execute('ALTER TABLE enhancements ADD COLUMN content_size INTEGER')
+                for row in db.execute('SELECT id, content FROM enhancements').fetchall():
+                    digest, size = self.blobs.put(row['content'] or '')
+                    db.execute('UPDATE enhancements SET content_hash = ?, content_size = ? WHERE id = ?',
+                               (digest, size, row['id']))
+                db.execute('ALTER TABLE enhancements DROP COLUMN content')
+            columns = self._columns(db, 'jobs')
+            if columns and 'content_hash' not in columns:
+                # Imports dedupe on content_hash, so saved jobs are hashed too
+                db.execute('ALTER TABLE jobs ADD COLUMN content_hash TEXT')
+                rows = db.execute('SELECT id, title, company, description FROM jobs').fetchall()
+                db.executemany('UPDATE jobs SET content_hash = ? WHERE id = ?',
+                               [(job_hash(dict(row)), row['id']) for row in rows])
+
+    def _reindex_jobs(self):
+        # Index inserts are idempotent, so workers racing here agree on the result
+        with self.lock:
+            if not self.reindex_pending:
+                return
+            db = self.db()
+            with db:
+                db.execute('BEGIN IMMEDIATE')
+                rows = db.execute('SELECT id, user_id, title, company, description FROM jobs '
+                                  'WHERE id NOT IN (SELECT job_id FROM job_terms)').fetchall()
+                for row in rows:
+                    self._index_job(db, row['user_id'], row['id'], dict(row))
+            self.reindex_pending = False
+
+    def _columns(self, db, table):
+        return {row['name'] for row in db.execute(f'PRAGMA table_info({table})')}
+
+    # Sessions
+    def touch(self, user_id):
+        # last_seen is only written once a minute per user, and idle users are
+        # swept at most once a minute per process
+        now = time.time()
+        with self.lock:
+            fresh = now - self.seen.get(user_id, 0) < 60
+            if not fresh:
+                self.seen[user_id] = now
+                self.seen.move_to_end(user_id)
+                while len(self.seen) > self.cache_size:
+                    self.seen.popitem(last=False)
+            sweep = now - self.last_eviction >= 60
+            if sweep:
+                self.last_eviction = now
+        if not fresh:
+            with self.db() as db:
+                db.execute('INSERT OR REPLACE INTO users (user_id, last_seen) VALUES (?, ?)', (user_id, now))
+        if sweep:
+            self.evict_idle(now - self.idle_ttl)
+
+    def evict_idle(self, cutoff):
+        db = self.db()
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            idle = [row['user_id'] for row in db.execute('SELECT user_id FROM users WHERE last_seen < ?', (cutoff,))]
+            digests = set()
+            for user_id in idle:
+                digests.update(self._enhancement_hashes(db, user_id))
+                for table in self.USER_TABLES:
+                    db.execute(f'DELETE FROM {table} WHERE user_id = ?', (user_id,))
+            self._release_blobs(db, digests)
+        with self.lock:
+            for user_id in idle:
+                self.profiles.pop(user_id, None)
+                self.seen.pop(user_id, None)
+        return len(idle)
+
+    def count_users(self):
+        return self.db().execute('SELECT COUNT(*) FROM users').fetchone()[0]
+
+    # Key/value state: the current CV, user info, pending generations, ...
+    def get_state(self, user_id, *keys):
+        # Only the requested keys are read and decoded; all of them if none are given
+        if keys:
+            rows = self.db().execute(
+                f"SELECT key, value FROM state WHERE user_id = ? AND key IN ({', '.join('?' * len(keys))})",
+                (user_id,) + keys
+            )
+        else:
+            rows = self.db().execute('SELECT key, value FROM state WHERE user_id = ?', (user_id,))
+        return {row['key']: json.loads(row['value']) for row in rows}
+
+    def has_state(self, user_id, key):
+        return self.db().execute('SELECT 1 FROM state WHERE user_id = ? AND key = ?',
+                                 (user_id, key)).fetchone() is not None
+
+    def set_state(self, user_id, **values):
+        with self.db() as db:
+            db.executemany(
+                'INSERT OR REPLACE INTO state (user_id, key, value) VALUES (?, ?, ?)',
+                [(user_id, key, json.dumps(value)) for key, value in values.items()]
+            )
+
+    def delete_state(self, user_id, *keys):
+        with self.db() as db:
+            db.executemany('DELETE FROM state WHERE user_id = ? AND key = ?',
+                           [(user_id, key) for key in keys])
+
+    # Merged skills profile. The parsed profile is cached per user and version;
+    # callers always get their own copy, since MergedProfile is mutable.
+    def load_profile(self, user_id):
+        return self._read_profile(user_id)[1]
+
+    def _read_profile(self, user_id):
+        row = self.db().execute('SELECT version FROM profiles WHERE user_id = ?', (user_id,)).fetchone()
+        if row is None:
+            return 0, MergedProfile()
+        with self.lock:
+            cached = self.profiles.get(user_id)
+        if cached and cached[0] == row['version']:
+            return cached[0], cached[1].copy()
+        
+        row = self.db().execute('SELECT data, version FROM profiles WHERE user_id = ?', (user_id,)).fetchone()
+        profile = MergedProfile.from_state(json.loads(row['data']))
+        self._cache_profile(user_id, row['version'], profile.copy())
+        return row['version'], profile
+
+    def _cache_profile(self, user_id, version, profile):
+        with self.lock:
+            self.profiles[user_id] = (version, profile)
+            self.profiles.move_to_end(user_id)
+            while len(self.profiles) > self.cache_size:
+                self.profiles.popitem(last=False)
+
+    def save_profile(self, user_id, profile):
+        # Replaces the profile outright; use update_profile to change it
+        with self.db() as db:
+            db.execute(
+                """INSERT INTO profiles (user_id, data, version) VALUES (?, ?, 1)
+                   ON CONFLICT (user_id) DO UPDATE SET data = excluded.data, version = version + 1""",
+                (user_id, json.dumps(profile.to_state()))
+            )
+            version = db.execute('SELECT version FROM profiles WHERE user_id = ?', (user_id,)).fetchone()['version']
+        self._cache_profile(user_id, version, profile.copy())
+
+    def update_profile(self, user_id, change, attempts=10):
+        # Optimistic read-modify-write: change(profile) runs on a private copy, and
+        # the result is only written if the stored version hasn't moved since it
+        # was read. Otherwise another worker got there first, so start over.
+        db = self.db()
+        for _ in range(attempts):
+            version, profile = self._read_profile(user_id)
+            change(profile)
+            data = json.dumps(profile.to_state())
+            with db:
+                db.execute('BEGIN IMMEDIATE')
+                row = db.execute('SELECT version FROM profiles WHERE user_id = ?', (user_id,)).fetchone()
+                if (row['version'] if row else 0) != version:
+                    continue
+                db.execute('INSERT OR REPLACE INTO profiles (user_id, data, version) VALUES (?, ?, ?)',
+                           (user_id, data, version + 1))
+            self._cache_profile(user_id, version + 1, profile.copy())
+            return profile
+        raise RuntimeError(f'Profile for {user_id} kept changing; gave up after {attempts} attempts')
+
+    # CV versions: a full snapshot every snapshot_interval versions and a
+    # compressed diff against the previous version in between
+    def add_cv_version(self, user_id, cv, description):
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        db = self.db()
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            version_number = db.execute('SELECT COALESCE(MAX(version_number), 0) + 1 FROM cv_versions WHERE user_id = ?',
+                                        (user_id,)).fetchone()[0]
+            kind, data = self._encode_cv(version_number, cv,
+                                         lambda: self._materialize(db, user_id, version_number - 1))
+            db.execute(
+                """INSERT INTO cv_versions (user_id, version_number, description, timestamp, preview, size, kind, data)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (user_id, version_number, description, timestamp, cv[:400], len(cv), kind, data)
+            )
+        return version_number
+
+    def _encode_cv(self, version_number, cv, previous):
+        # A snapshot every snapshot_interval versions; otherwise a diff against
+        # previous(), the text of the version before, when that is smaller
+        data = pack(cv)
+        if (version_number - 1) % self.snapshot_interval:
+            delta = pack(make_delta(previous(), cv))
+            if len(delta) < len(data):
+                return 'delta', delta
+        return 'snapshot', data
+
+    def _materialize(self, db, user_id, version_number):
+        rows = db.execute(
+            """SELECT kind, data FROM cv_versions
+               WHERE user_id = ? AND version_number <= ? AND version_number >= (
+                   SELECT MAX(version_number) FROM cv_versions
+                   WHERE user_id = ? AND version_number <= ? AND kind = 'snapshot')
+               ORDER BY version_number""",
+            (user_id, version_number, user_id, version_number)
+        ).fetchall()
+        text = ''
+        for row in rows:
+            text = unpack(row['data']) if row['kind'] == 'snapshot' else apply_delta(text, unpack(row['data']))
+        return text
+
+    def list_cv_versions(self, user_id):
+        # Metadata and the stored preview only; nothing is decompressed
+        rows = self.db().execute(
+            """SELECT version_number, description, timestamp, preview, size, kind
+               FROM cv_versions WHERE user_id = ? ORDER BY version_number""",
+            (user_id,)
+        )
+        return [dict(row) for row in rows]
+
+    def get_cv_version(self, user_id, version_number):
+        db = self.db()
+        row = db.execute(
+            """SELECT version_number, description, timestamp, preview, size, kind
+               FROM cv_versions WHERE user_id = ? AND version_number = ?""",
+            (user_id, version_number)
+        ).fetchone()
+        if row is None:
+            return None
+        version = dict(row)
+        version['cv'] = self._materialize(db, user_id, version_number)
+        return version
+
+    def count_cv_versions(self, user_id):
+        return self.db().execute('SELECT COUNT(*) FROM cv_versions WHERE user_id = ?', (user_id,)).fetchone()[0]
+
+    def clear_cv_versions(self, user_id):
+        with self.db() as db:
+            db.execute('DELETE FROM cv_versions WHERE user_id = ?', (user_id,))
+
+    # Enhancement documents
+    def add_enhancement(self, user_id, enhancement_id, filename, content):
+        digest, size = self.blobs.put(content)
+        with self.db() as db:
+            db.execute(
+                'INSERT INTO enhancements (id, user_id, filename, content_hash, content_size, date_added) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (enhancement_id, user_id, filename, digest, size, datetime.now().strftime('%Y-%m-%d %H:%M'))
+            )
+        # A delete that committed between the first put and the insert may have
+        # released this same blob; put only writes it again if it is missing
+        self.blobs.put(content)
+
+    def get_enhancement_content(self, user_id, enhancement_id):
+        # Raw text is only read from disk when something asks for it
+        row = self.db().execute('SELECT content_hash FROM enhancements WHERE id = ? AND user_id = ?',
+                                (enhancement_id, user_id)).fetchone()
+        return self.blobs.get(row['content_hash']) if row else None
+
+    def _enhancement_hashes(self, db, user_id):
+        return {row['content_hash'] for row in
+                db.execute('SELECT content_hash FROM enhancements WHERE user_id = ?', (user_id,))}
+
+    def _release_blobs(self, db, digests):
+        # A blob is deleted once no enhancement row refers to it any more. Called
+        # inside the transaction that deleted the rows, so no insert can land
+        # between the check and the delete
+        for digest in digests:
+            if not db.execute('SELECT 1 FROM enhancements WHERE content_hash = ? LIMIT 1', (digest,)).fetchone():
+                self.blobs.delete(digest)
+
+    def list_enhancements(self, user_id):
+        rows = self.db().execute(
+            'SELECT id, filename, date_added FROM enhancements WHERE user_id = ? ORDER BY rowid', (user_id,)
+        )
+        return [dict(row) for row in rows]
+
+    def clear_enhancements(self, user_id):
+        db = self.db()
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            digests = self._enhancement_hashes(db, user_id)
+            db.execute('DELETE FROM enhancements WHERE user_id = ?', (user_id,))
+            self._release_blobs(db, digests)
+
+    def count_enhancements(self, user_id):
+        return self.db().execute('SELECT COUNT(*) FROM enhancements WHERE user_id = ?', (user_id,)).fetchone()[0]
+
+    def remove_enhancement(self, user_id, index):
+        # Enhancements are addressed by their position in upload order
+        db = self.db()
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            row = db.execute(
+                'SELECT id, filename, content_hash FROM enhancements WHERE user_id = ? ORDER BY rowid LIMIT 1 OFFSET ?',
+                (user_id, index)
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute('DELETE FROM enhancements WHERE id = ?', (row['id'],))
+            self._release_blobs(db, {row['content_hash']})
+        return {'id': row['id'], 'filename': row['filename']}
+
+    # Saved jobs, with an inverted index from normalized skill/keyword to job id
+    INDEXED_JOB_FIELDS = ('title', 'company', 'description')
+
+    def _job(self, row):
+        job = dict(row)
+        job['applied'] = bool(job['applied'])
+        job['match_result'] = json.loads(job['match_result']) if job['match_result'] else None
+        return job
+
+    def add_job(self, user_id, **fields):
+        fields.setdefault('date_added', datetime.now().strftime('%Y-%m-%d %H:%M'))
+        fields = {key: value for key, value in fields.items() if key in self.JOB_FIELDS}
+        fields['content_hash'] = job_hash(fields)
+        if 'match_result' in fields:
+            fields['match_result'] = json.dumps(fields['match_result'])
+        columns = ', '.join(['user_id'] + list(fields))
+        placeholders = ', '.join('?' * (len(fields) + 1))
+        with self.db() as db:
+            cursor = db.execute(f'INSERT INTO jobs ({columns}) VALUES ({placeholders})',
+                                [user_id] + list(fields.values()))
+            self._index_job(db, user_id, cursor.lastrowid, fields)
+        return cursor.lastrowid
+
+    def add_jobs(self, user_id, jobs):
+        # Bulk insert in one transaction; jobs whose content_hash is already saved,
+        # or repeated within the batch, are skipped. Returns the number inserted.
+        date_added = datetime.now().strftime('%Y-%m-%d %H:%M')
+        with self.db() as db:
+            hashes = [job['content_hash'] for job in jobs]
+            existing = {row[0] for row in db.execute(
+                f"SELECT content_hash FROM jobs WHERE user_id = ? AND content_hash IN ({', '.join('?' * len(hashes))})",
+                [user_id] + hashes
+            )}
+            added = 0
+            for job in jobs:
+                if job['content_hash'] in existing:
+                    continue
+                existing.add(job['content_hash'])
+                cursor = db.execute(
+                    'INSERT INTO jobs (user_id, title, company, description, date_added, content_hash) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (user_id, job['title'], job['company'], job['description'], date_added, job['content_hash'])
+                )
+                self._index_job(db, user_id, cursor.lastrowid, job)
+                added += 1
+        return added
+
+    def _index_job(self, db, user_id, job_id, fields):
+        text = '\n'.join(fields.get(key) or '' for key in self.INDEXED_JOB_FIELDS)
+        db.executemany('INSERT OR IGNORE INTO job_terms (user_id, term, job_id) VALUES (?, ?, ?)',
+                       [(user_id, term, job_id) for term in index_terms(text)])
+
+    def get_job(self, user_id, job_id):
+        row = self.db().execute('SELECT * FROM jobs WHERE id = ? AND user_id = ?', (job_id, user_id)).fetchone()
+        return self._job(row) if row else None
+
+    def list_jobs(self, user_id):
+        rows = self.db().execute('SELECT * FROM jobs WHERE user_id = ? ORDER BY id', (user_id,))
+        return [self._job(row) for row in rows]
+
+    def count_jobs(self, user_id):
+        return self.db().execute('SELECT COUNT(*) FROM jobs WHERE user_id = ?', (user_id,)).fetchone()[0]
+
+    def update_job(self, user_id, job_id, **fields):
+        if 'match_result' in fields:
+            fields['match_result'] = json.dumps(fields['match_result'])
+        assignments = ', '.join(f'{key} = ?' for key in fields if key in self.JOB_FIELDS)
+        values = [value for key, value in fields.items() if key in self.JOB_FIELDS]
+        with self.db() as db:
+            db.execute(f'UPDATE jobs SET {assignments} WHERE id = ? AND user_id = ?', values + [job_id, user_id])
+            if any(key in fields for key in self.INDEXED_JOB_FIELDS):
+                row = db.execute('SELECT * FROM jobs WHERE id = ? AND user_id = ?', (job_id, user_id)).fetchone()
+                if row:
+                    db.execute('UPDATE jobs SET content_hash = ? WHERE id = ?', (job_hash(dict(row)), job_id))
+                    db.execute('DELETE FROM job_terms WHERE job_id = ?', (job_id,))
+                    self._index_job(db, user_id, job_id, dict(row))
+
+    def delete_job(self, user_id, job_id):
+        with self.db() as db:
+            deleted = db.execute('DELETE FROM jobs WHERE id = ? AND user_id = ?', (job_id, user_id)).rowcount
+            if deleted:
+                db.execute('DELETE FROM job_terms WHERE job_id = ?', (job_id,))
+
+    def search_jobs(self, user_id, terms=(), company=None, applied=None, min_score=None, max_score=None,
+                    sort=None, limit=None, offset=0):
+        # Every term must match; returns (jobs, total matching before limit/offset)
+        if self.reindex_pending:
+            self._reindex_jobs()
+        where = ['user_id = ?']
+        params = [user_id]
+        for term in terms:
+            where.append('id IN (SELECT job_id FROM job_terms WHERE user_id = ? AND term = ?)')
+            params += [user_id, term]
+        if company:
+            where.append("company LIKE ? ESCAPE '\\'")
+            params.append('%' + re.sub(r'([%_\\])', r'\\\1', company) + '%')
+        if applied is not None:
+            where.append('applied = ?')
+            params.append(int(applied))
+        if min_score is not None:
+            where.append('match_score >= ?')
+            params.append(min_score)
+        if max_score is not None:
+            where.append('match_score <= ?')
+            params.append(max_score)
+        clause = ' AND '.join(where)
+        order = 'match_score IS NULL, match_score DESC, id' if sort == 'score' else 'id'
+        db = self.db()
+        total = db.execute(f'SELECT COUNT(*) FROM jobs WHERE {clause}', params).fetchone()[0]
+        rows = db.execute(f'SELECT * FROM jobs WHERE {clause} ORDER BY {order} LIMIT ? OFFSET ?',
+                          params + [-1 if limit is None else limit, offset])
+        return [self._job(row) for row in rows], total
+
+    # Background task status, so any worker process can answer a poll
+    def save_task(self, task):
+        with self.db() as db:
+            db.execute('INSERT OR REPLACE INTO tasks (id, user_id, data, finished) VALUES (?, ?, ?, ?)',
+                       (task['id'], task['user_id'], json.dumps(task), task['finished']))
+
+    def get_task(self, task_id):
+        row = self.db().execute('SELECT data FROM tasks WHERE id = ?', (task_id,)).fetchone()
+        return json.loads(row['data']) if row else None
+
+    def delete_tasks_before(self, cutoff):
+        with self.db() as db:
+            db.execute('DELETE FROM tasks WHERE finished < ?', (cutoff,))
+
+    def reset(self, user_id):
+        db = self.db()
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            digests = self._enhancement_hashes(db, user_id)
+            for table in ('state', 'profiles', 'cv_versions', 'enhancements', 'jobs', 'job_terms'):
+                db.execute(f'DELETE FROM {table} WHERE user_id = ?', (user_id,))
+            self._release_blobs(db, digests)
+        with self.lock:
+            self.profiles.pop(user_id, None)
+
+    def usage(self, user_id):
+        # Bytes held for one session: rows in the database, blobs on disk and
+        # the parsed profile kept in this process
+        db = self.db()
+        def total(sql):
+            return db.execute(sql, (user_id,)).fetchone()[0] or 0
+        rows = {
+            'state': total('SELECT SUM(LENGTH(key) + LENGTH(value)) FROM state WHERE user_id = ?'),
+            'profile': total('SELECT SUM(LENGTH(data)) FROM profiles WHERE user_id = ?'),
+            'cv_versions': total('SELECT SUM(LENGTH(data) + LENGTH(preview)) FROM cv_versions WHERE user_id = ?'),
+            'enhancements': total('SELECT SUM(LENGTH(id) + LENGTH(filename) + LENGTH(content_hash)) '
+                                  'FROM enhancements WHERE user_id = ?'),
+            'jobs': total('SELECT SUM(LENGTH(title) + LENGTH(company) + LENGTH(description) + '
+                          'IFNULL(LENGTH(match_result), 0) + IFNULL(LENGTH(scored_cv), 0)) FROM jobs WHERE user_id = ?')
+        }
+        digests = self._enhancement_hashes(db, user_id)
+        with self.lock:
+            cached = self.profiles.get(user_id)
+        return {
+            'database_bytes': rows,
+            'enhancement_text_bytes': total('SELECT SUM(content_size) FROM enhancements WHERE user_id = ?'),
+            'blob_bytes_on_disk': sum(self.blobs.size(digest) for digest in digests),
+            'profile_cache_bytes': len(json.dumps(cached[1].to_state())) if cached else 0
+        }
+
+store = Store(app.config['DATABASE'], BlobStore(app.config['BLOB_DIR']), app.config['SESSION_IDLE_TTL'],
+              app.config['SESSION_CACHE_SIZE'], app.config['CV_SNAPSHOT_INTERVAL'])
+
+def current_user():
+    # Each browser gets its own id in the signed session cookie
+    if 'user_id' not in session:
+        session['user_id'] = uuid.uuid4().hex
+        session.permanent = True
+    store.touch(session['user_id'])
+    return session['user_id']
+
+# Shared pool for model calls that don't depend on each other
+llm_executor = ThreadPoolExecutor(max_workers=app.config['LLM_MAX_WORKERS'])
+
+def submit_model_call(fn, *args, executor=llm_executor, slots=None):
+    # In async serving mode prompt functions run on the model loop instead of a
+    # pool thread. slots, an asyncio.Semaphore, then does the job of the executor's
+    # size and caps how many of the submitted calls run at once.
+    if app.config['SERVING_MODE'] == 'async' and fn in ASYNC_VARIANTS:
+        coro = ASYNC_VARIANTS[fn](*args)
+        return submit_async(limited(slots, coro) if slots else coro)
+    return executor.submit(fn, *args)
+
+def run_model_call(fn, *args, **kwargs):
+    # A single prompt function called from a request or task thread: on the model
+    # loop in async serving mode, directly on this thread otherwise
+    if app.config['SERVING_MODE'] == 'async' and fn in ASYNC_VARIANTS:
+        return run_async(ASYNC_VARIANTS[fn](*args, **kwargs))
+    return fn(*args, **kwargs)
+
+def run_parallel(*calls):
+    # Each call is (function, *args); results come back in the same order
+    futures = [submit_model_call(fn, *args) for fn, *args in calls]
+    return [future.result() for future in futures]
+
+class TaskRunner:
+    """Runs slow, model-heavy work on a bounded worker pool.
+
+    Routes submit a pipeline and hand the task id back to the browser, which
+    polls /tasks/<id> until the result is ready. Task functions receive a
+    report(progress, message) callback as their first argument. Status is
+    written through to the store so any worker process can answer the poll.
+    """
+
+    def __init__(self, store, max_workers=4, result_ttl=3600):
+        self.store = store
+        self.max_workers = max_workers
+        self.result_ttl = result_ttl
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.tasks = {}
+        self.durations = defaultdict(lambda: deque(maxlen=500))
+        self.lock = threading.Lock()
+
+    def submit(self, kind, fn, *args, user_id=None):
+        task = {
+            'id': uuid.uuid4().hex,
+            'user_id': user_id,
+            'kind': kind,
+            'status': 'queued',
+            'progress': 0,
+            'message': 'Waiting for a free worker',
+            'result': None,
+            'error': None,
+            'created': time.time(),
+            'started': None,
+            'finished': None
+        }
+        with self.lock:
+            self._evict_expired()
+            self.tasks[task['id']] = task
+        self.store.save_task(task)
+        self.executor.submit(self._run, task, fn, args)
+        return task['id']
+
+    def _run(self, task, fn, args):
+        def report(progress, message):
+            with self.lock:
+                task['progress'] = progress
+                task['message'] = message
+            self.store.save_task(task)
+
+        with self.lock:
+            task['status'] = 'running'
+            task['started'] = time.time()
+        self.store.save_task(task)
+        try:
+            result = fn(report, *args)
+            update = {'status': 'done', 'progress': 100, 'message': 'Done', 'result': result}
+        except Exception as e:
+            update = {'status': 'failed', 'message': 'Failed', 'error': str(e)}
+        with self.lock:
+            task.update(update)
+            task['finished'] = time.time()
+            self.durations[task['kind']].append(task['finished'] - task['started'])
+        self.store.save_task(task)
+
+    def _evict_expired(self):
+        cutoff = time.time() - self.result_ttl
+        expired = [task_id for task_id, task in self.tasks.items()
+                   if task['finished'] and task['finished'] < cutoff]
+        for task_id in expired:
+            del self.tasks[task_id]
+        self.store.delete_tasks_before(cutoff)
+
+    def get(self, task_id):
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task:
+                return dict(task)
+        return self.store.get_task(task_id)
+
+    def stats(self):
+        with self.lock:
+            statuses = [task['status'] for task in self.tasks.values()]
+            durations = {kind: sorted(values) for kind, values in self.durations.items()}
+        kinds = {}
+        for kind, values in durations.items():
+            if values:
+                kinds[kind] = {
+                    'count': len(values),
+                    'avg_seconds': round(sum(values) / len(values), 3),
+                    'p95_seconds': round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+                    'max_seconds': round(values[-1], 3)
+                }
+        return {
+            'max_workers': self.max_workers,
+            'queue_depth': statuses.count('queued'),
+            'running': statuses.count('running'),
+            'done': statuses.count('done'),
+            'failed': statuses.count('failed'),
+            'durations': kinds
+        }
+
+task_runner = TaskRunner(store, app.config['TASK_MAX_WORKERS'], app.config['TASK_RESULT_TTL'])
+
+def no_progress(progress, message):
+    pass
+
+class LLMCache:
+    """LRU cache of model responses keyed by a hash of model + max_tokens + prompt.
+
+    Entries are optionally mirrored to disk so they survive restarts. The disk
+    copy of an entry is removed when the LRU evicts it, and on startup only the
+    newest max_entries files are kept. Hit/miss counters are kept per prompt function.
+    """
+
+    def __init__(self, max_entries=256, disk_dir=None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.entries = OrderedDict()
+        self.stats = defaultdict(lambda: {'hits': 0, 'misses': 0})
+        self.lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._prune_disk()
+
+    def _prune_disk(self):
+        # Entries left by earlier runs; temp files may belong to another worker's write
+        paths = [os.path.join(self.disk_dir, name) for name in os.listdir(self.disk_dir) if name.endswith('.json')]
+        paths.sort(key=os.path.getmtime, reverse=True)
+        for path in paths[self.max_entries:]:
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def make_key(model, max_tokens, prompt):
+        payload = json.dumps([model, max_tokens, prompt], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f'{key}.json')
+
+    def get(self, name, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.stats[name]['hits'] += 1
+                return self.entries[key]
+        if self.disk_dir and os.path.exists(self._disk_path(key)):
+            try:
+                with open(self._disk_path(key), encoding='utf-8') as f:
+                    text = json.load(f)['text']
+                self._remember(key, text)
+                with self.lock:
+                    self.stats[name]['hits'] += 1
+                return text
+            except (OSError, ValueError, KeyError):
+                pass
+        with self.lock:
+            self.stats[name]['misses'] += 1
+        return None
+
+    def put(self, key, text):
+        self._remember(key, text)
+        if self.disk_dir:
+            tmp_path = f'{self._disk_path(key)}.{uuid.uuid4().hex}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'text': text}, f)
+            os.replace(tmp_path, self._disk_path(key))
+
+    def _remember(self, key, text):
+        evicted = []
+        with self.lock:
+            self.entries[key] = text
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                evicted.append(self.entries.popitem(last=False)[0])
+        if self.disk_dir:
+            for old_key in evicted:
+                self._remove(self._disk_path(old_key))
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'functions': {name: dict(counts) for name, counts in self.stats.items()}
+            }
+
+llm_cache = LLMCache(app.config['LLM_CACHE_SIZE'], app.config['LLM_CACHE_DIR'])
+
+class TokenUsage:
+    """Token counts reported by the API, including prompt-cache reads and writes.
+
+    Totals are kept per prompt function, along with the most recent calls.
+    """
+
+    FIELDS = ('input_tokens', 'output_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens')
+
+    def __init__(self, recent=200):
+        self.totals = defaultdict(lambda: dict.fromkeys(('calls',) + self.FIELDS, 0))
+        self.recent = deque(maxlen=recent)
+        self.lock = threading.Lock()
+
+    def record(self, name, usage, model=None):
+        counts = {field: getattr(usage, field, 0) or 0 for field in self.FIELDS}
+        with self.lock:
+            totals = self.totals[name]
+            totals['calls'] += 1
+            for field, value in counts.items():
+                totals[field] += value
+            self.recent.append(dict(counts, name=name, model=model, time=round(time.time(), 3)))
+
+    def snapshot(self):
+        with self.lock:
+            functions = {name: dict(totals) for name, totals in self.totals.items()}
+            recent = list(self.recent)[-20:]
+        for totals in functions.values():
+            prompt_tokens = (totals['input_tokens'] + totals['cache_creation_input_tokens']
+                             + totals['cache_read_input_tokens'])
+            totals['cache_read_ratio'] = round(totals['cache_read_input_tokens'] / prompt_tokens, 3) if prompt_tokens else 0
+        return {'functions': functions, 'recent': recent}
+
+token_usage = TokenUsage()
+
+class Metrics:
+    """Counters, gauges and histograms rendered in the Prometheus text format."""
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+    def __init__(self):
+        self.counters = defaultdict(float)
+        self.gauges = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _labels(labels):
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, metric, amount=1, **labels):
+        with self.lock:
+            self.counters[(metric, self._labels(labels))] += amount
+
+    def set_counter(self, metric, value, **labels):
+        # For cumulative counts that another object keeps, e.g. LLMCache.stats
+        with self.lock:
+            self.counters[(metric, self._labels(labels))] = value
+
+    def set_gauge(self, metric, value, **labels):
+        with self.lock:
+            self.gauges[(metric, self._labels(labels))] = value
+
+    def observe(self, metric, value, **labels):
+        key = (metric, self._labels(labels))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = {'buckets': [0] * len(self.BUCKETS), 'sum': 0.0, 'count': 0}
+            histogram = self.histograms[key]
+            for i, bound in enumerate(self.BUCKETS):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    @staticmethod
+    def _value(value):
+        # Whole numbers print exactly; :g would turn 1234567 tokens into 1.23457e+06
+        value = float(value)
+        return str(int(value)) if value.is_integer() else repr(value)
+
+    @staticmethod
+    def _format(metric, labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return metric
+        escaped = ','.join('{}="{}"'.format(key, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                           for key, value in pairs)
+        return f'{metric}{{{escaped}}}'
+
+    def render(self):
+        with self.lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            histograms = {key: {'buckets': list(h['buckets']), 'sum': h['sum'], 'count': h['count']}
+                          for key, h in self.histograms.items()}
+        lines = []
+        for kind, values in (('counter', counters), ('gauge', gauges)):
+            for metric in sorted({metric for metric, labels in values}):
+                lines.append(f'# TYPE {metric} {kind}')
+                for (name, labels), value in sorted(values.items()):
+                    if name == metric:
+                        lines.append(f'{self._format(metric, labels)} {self._value(value)}')
+        for metric in sorted({metric for metric, labels in histograms}):
+            lines.append(f'# TYPE {metric} histogram')
+            for (name, labels), histogram in sorted(histograms.items()):
+                if name != metric:
+                    continue
+                for bound, count in zip(self.BUCKETS, histogram['buckets']):
+                    lines.append(f"{self._format(metric + '_bucket', labels, [('le', f'{bound:g}')])} {count}")
+                lines.append(f"{self._format(metric + '_bucket', labels, [('le', '+Inf')])} {histogram['count']}")
+                lines.append(f"{self._format(metric + '_sum', labels)} {histogram['sum']:.6f}")
+                lines.append(f"{self._format(metric + '_count', labels)} {histogram['count']}")
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+def record_message(name, model, message):
+    model = getattr(message, 'model', None) or model
+    token_usage.record(name, message.usage, model)
+    for field in TokenUsage.FIELDS:
+        tokens = getattr(message.usage, field, 0) or 0
+        if tokens:
+            metrics.inc('llm_tokens_total', tokens, function=name, model=model, type=field)
+    metrics.inc('llm_requests_total', function=name, model=model,
+                stop_reason=getattr(message, 'stop_reason', None) or 'unknown')
+
+def timed_create(name, api, model, **request):
+    # Every messages.create goes through here so it is timed and tagged by prompt function
+    started = time.perf_counter()
+    try:
+        message = api.messages.create(model=model, **request)
+    except Exception as e:
+        metrics.inc('llm_request_errors_total', function=name, model=model, error=type(e).__name__)
+        raise
+    finally:
+        metrics.observe('llm_request_duration_seconds', time.perf_counter() - started, function=name, model=model)
+    record_message(name, model, message)
+    return message
+
+async def atimed_create(name, api, model, **request):
+    started = time.perf_counter()
+    try:
+        message = await api.messages.create(model=model, **request)
+    except Exception as e:
+        metrics.inc('llm_request_errors_total', function=name, model=model, error=type(e).__name__)
+        raise
+    finally:
+        metrics.observe('llm_request_duration_seconds', time.perf_counter() - started, function=name, model=model)
+    record_message(name, model, message)
+    return message
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    # For streamed responses this is the time until the headers are sent
+    started = g.get('request_started')
+    if started is not None:
+        metrics.observe('http_request_duration_seconds', time.perf_counter() - started,
+                        endpoint=request.endpoint or 'unknown', method=request.method, status=response.status_code)
+    return response
+
+def min_cacheable_tokens(model):
+    # Shorter prefixes are never cached, whatever the breakpoint says
+    return 2048 if 'haiku' in model else 1024
+
+def cached_prompt(name, cv_data, instructions):
+    # The CV goes first in its own block, so repeated calls of one route with the
+    # same CV (e.g. matching it against many jobs) can reuse a cached prefix.
+    # Caches are per model, so routes on different models never share one. The
+    # breakpoint is only added when the CV is long enough to be cached at all.
+    cv_block = {"type": "text", "text": f"Candidate CV:\n{cv_data}"}
+    if estimate_tokens(cv_block['text']) >= min_cacheable_tokens(get_route(name)['model']):
+        cv_block['cache_control'] = {"type": "ephemeral"}
+    return [cv_block, {"type": "text", "text": instructions}]
+
+def get_route(name):
+    return {**DEFAULT_ROUTE, **app.config['MODEL_ROUTES'].get(name, {})}
+
+class ModelUnavailable(Exception):
+    """Raised instead of calling a model whose circuit breaker is open."""
+
+    def __init__(self, model):
+        super().__init__('The AI service is having trouble right now, please try again in a minute')
+        self.model = model
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive upstream failures and rejects calls for
+    `cooldown` seconds, then lets a single trial call through."""
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return 'open'
+        return 'half_open'
+
+    def allow(self):
+        with self.lock:
+            state = self.state()
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record(self, ok):
+        with self.lock:
+            self.trial_running = False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        # The call was abandoned (hedge loser, client gone) and says nothing about the upstream
+        with self.lock:
+            self.trial_running = False
+
+circuit_breakers = {}
+circuit_breakers_lock = threading.Lock()
+
+def acquire_breaker(name, model):
+    with circuit_breakers_lock:
+        if model not in circuit_breakers:
+            circuit_breakers[model] = CircuitBreaker(app.config['CIRCUIT_FAILURE_THRESHOLD'],
+                                                     app.config['CIRCUIT_COOLDOWN'])
+        breaker = circuit_breakers[model]
+    if not breaker.allow():
+        metrics.inc('llm_circuit_rejections_total', function=name, model=model)
+        raise ModelUnavailable(model)
+    return breaker
+
+def is_retryable(error):
+    # Rate limits, overload (529), server errors, timeouts and dropped connections
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, anthropic.APIConnectionError)
+
+def is_outage(error):
+    # A 429 is our own quota, not a sign that the model is down
+    return is_retryable(error) and getattr(error, 'status_code', None) != 429
+
+def retry_delay(error, attempt):
+    # Exponential backoff with full jitter, or longer if the server sent retry-after
+    ceiling = min(app.config['LLM_RETRY_MAX_DELAY'], app.config['LLM_RETRY_BASE_DELAY'] * 2 ** attempt)
+    delay = random.uniform(0, ceiling)
+    try:
+        delay = max(delay, float(error.response.headers.get('retry-after')))
+    except (AttributeError, TypeError, ValueError):
+        pass
+    return delay
+
+def attempt_create(name, api, model, timeout, request):
+    breaker = acquire_breaker(name, model)
+    try:
+        message = timed_create(name, api, model, timeout=timeout, **request)
+    except Exception as e:
+        breaker.record(not is_outage(e))
+        raise
+    breaker.record(True)
+    return message
+
+# Hedged duplicates get their own pool so they never queue behind the calls they hedge
+hedge_executor = ThreadPoolExecutor(max_workers=app.config['LLM_MAX_WORKERS'] * 2)
+
+def first_success(name, done, pending, second):
+    # Returns the finished future to use, or None to keep waiting on the other one
+    for future in done:
+        if future.exception() is None:
+            if future is second:
+                metrics.inc('llm_hedge_wins_total', function=name)
+            return future
+    return None if pending else done.pop()
+
+def hedged(name, hedge_after, call):
+    # Sends a duplicate request if the first has not answered within hedge_after seconds
+    # and returns whichever succeeds first; the slower one finishes in the background
+    first = hedge_executor.submit(call)
+    done, pending = wait([first], timeout=hedge_after)
+    if done:
+        return first.result()
+    metrics.inc('llm_hedged_requests_total', function=name)
+    second = hedge_executor.submit(call)
+    pending = {first, second}
+    while True:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        winner = first_success(name, done, pending, second)
+        if winner:
+            return winner.result()
+
+def call_with_retries(name, route, model, request, deadline):
+    # The SDK's own retries are off so that backoff stays inside the deadline
+    api = client.with_options(max_retries=0)
+    for attempt in itertools.count():
+        timeout = min(route['timeout'], deadline - time.monotonic())
+        call = lambda: attempt_create(name, api, model, timeout, request)
+        try:
+            if route['hedge_after']:
+                return hedged(name, route['hedge_after'], call)
+            return call()
+        except Exception as e:
+            delay = retry_delay(e, attempt)
+            if not is_retryable(e) or attempt >= route['retries'] or time.monotonic() + delay >= deadline:
+                raise
+            metrics.inc('llm_retries_total', function=name, model=model, error=type(e).__name__)
+        time.sleep(delay)
+
+def create_message(name, route, model, max_tokens, prompt):
+    request = {'max_tokens': max_tokens, 'messages': [{"role": "user", "content": prompt}]}
+    deadline = time.monotonic() + route['deadline']
+    if route['fallback'] and route['latency_budget']:
+        try:
+            # One attempt only: a slow or failing primary should hand over to the fallback quickly
+            return attempt_create(name, client.with_options(max_retries=0), model,
+                                  route['latency_budget'], request)
+        except Exception as e:
+            if not (is_retryable(e) or isinstance(e, ModelUnavailable)):
+                raise
+            model = route['fallback']
+    return call_with_retries(name, route, model, request, deadline)
+
+def call_model(name, prompt, max_tokens=None, use_cache=True, model=None):
+    # name is the prompt function; it selects the route and tags cache statistics
+    route = get_route(name)
+    model = model or route['model']
+    max_tokens = max_tokens or route['max_tokens']
+    key = LLMCache.make_key(model, max_tokens, prompt)
+    if use_cache:
+        cached = llm_cache.get(name, key)
+        if cached is not None:
+            return cached
+
+    message = create_message(name, route, model, max_tokens, prompt)
+    text = message.content[0].text
+
+    if use_cache:
+        llm_cache.put(key, text)
+    return text
+
+def stream_model(name, prompt, max_tokens=None, use_cache=True, model=None):
+    # Yields text deltas as they arrive; the full text is cached once the stream ends.
+    # Streams use the route's primary model only, since text is already on screen
+    route = get_route(name)
+    model = model or route['model']
+    max_tokens = max_tokens or route['max_tokens']
+    key = LLMCache.make_key(model, max_tokens, prompt)
+    if use_cache:
+        cached = llm_cache.get(name, key)
+        if cached is not None:
+            yield cached
+            return
+
+    chunks = []
+    api = client.with_options(max_retries=0)
+    deadline = time.monotonic() + route['deadline']
+    for attempt in itertools.count():
+        breaker = acquire_breaker(name, model)
+        started = time.perf_counter()
+        try:
+            with api.messages.stream(
+                model=model,
+                max_tokens=max_tokens,
+                messages=[{"role": "user", "content": prompt}],
+                timeout=min(route['timeout'], deadline - time.monotonic())
+            ) as stream:
+                for text in stream.text_stream:
+                    if not chunks:
+                        metrics.observe('llm_time_to_first_token_seconds', time.perf_counter() - started,
+                                        function=name, model=model)
+                    chunks.append(text)
+                    yield text
+                record_message(name, model, stream.get_final_message())
+        except GeneratorExit:
+            breaker.release()
+            raise
+        except Exception as e:
+            metrics.inc('llm_request_errors_total', function=name, model=model, error=type(e).__name__)
+            breaker.record(not is_outage(e))
+            # Text already on screen can't be taken back, so only retry before the first token
+            delay = retry_delay(e, attempt)
+            if (chunks or not is_retryable(e) or attempt >= route['retries']
+                    or time.monotonic() + delay >= deadline):
+                raise
+            metrics.inc('llm_retries_total', function=name, model=model, error=type(e).__name__)
+            time.sleep(delay)
+            continue
+        finally:
+            metrics.observe('llm_request_duration_seconds', time.perf_counter() - started, function=name, model=model)
+        breaker.record(True)
+        break
+
+    if use_cache:
+        llm_cache.put(key, ''.join(chunks))
+
+# Async model calls share one event loop thread and one AsyncAnthropic client,
+# so thousands of in-flight requests reuse a single connection pool
+async_loop = None
+async_loop_lock = threading.Lock()
+async_client = None
+# LLM_MAX_INFLIGHT cap per event loop, made on first use inside that loop, so the
+# async prompt functions also work when awaited from a caller's own loop
+async_slots = weakref.WeakKeyDictionary()
+
+def get_async_loop():
+    global async_loop
+    with async_loop_lock:
+        if async_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='model-loop', daemon=True).start()
+            async_loop = loop
+        return async_loop
+
+def inflight_slots():
+    loop = asyncio.get_running_loop()
+    slots = async_slots.get(loop)
+    if slots is None:
+        slots = async_slots[loop] = asyncio.Semaphore(app.config['LLM_MAX_INFLIGHT'])
+    return slots
+
+def get_async_client():
+    global async_client
+    if async_client is None:
+        async_client = anthropic.AsyncAnthropic(api_key=client.api_key)
+    return async_client
+
+def submit_async(coro):
+    return asyncio.run_coroutine_threadsafe(coro, get_async_loop())
+
+def run_async(coro):
+    # Blocks the calling thread until coro has finished on the model loop
+    return submit_async(coro).result()
+
+async def limited(slots, coro):
+    async with slots:
+        return await coro
+
+async def aattempt_create(name, api, model, timeout, request):
+    breaker = acquire_breaker(name, model)
+    try:
+        message = await atimed_create(name, api, model, timeout=timeout, **request)
+    except asyncio.CancelledError:
+        breaker.release()
+        raise
+    except Exception as e:
+        breaker.record(not is_outage(e))
+        raise
+    breaker.record(True)
+    return message
+
+async def ahedged(name, hedge_after, call):
+    # Unlike the thread version, the losing request is cancelled
+    first = asyncio.ensure_future(call())
+    pending = {first}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=hedge_after)
+        if done:
+            return first.result()
+        metrics.inc('llm_hedged_requests_total', function=name)
+        second = asyncio.ensure_future(call())
+        pending = {first, second}
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = first_success(name, done, pending, second)
+            if winner:
+                return winner.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def acall_with_retries(name, route, model, request, deadline):
+    api = get_async_client().with_options(max_retries=0)
+    for attempt in itertools.count():
+        timeout = min(route['timeout'], deadline - time.monotonic())
+        call = lambda: aattempt_create(name, api, model, timeout, request)
+        try:
+            if route['hedge_after']:
+                return await ahedged(name, route['hedge_after'], call)
+            return await call()
+        except Exception as e:
+            delay = retry_delay(e, attempt)
+            if not is_retryable(e) or attempt >= route['retries'] or time.monotonic() + delay >= deadline:
+                raise
+            metrics.inc('llm_retries_total', function=name, model=model, error=type(e).__name__)
+        await asyncio.sleep(delay)
+
+async def acreate_message(name, route, model, max_tokens, prompt):
+    request = {'max_tokens': max_tokens, 'messages': [{"role": "user", "content": prompt}]}
+    deadline = time.monotonic() + route['deadline']
+    if route['fallback'] and route['latency_budget']:
+        try:
+            return await aattempt_create(name, get_async_client().with_options(max_retries=0), model,
+                                         route['latency_budget'], request)
+        except Exception as e:
+            if not (is_retryable(e) or isinstance(e, ModelUnavailable)):
+                raise
+            model = route['fallback']
+    return await acall_with_retries(name, route, model, request, deadline)
+
+async def acall_model(name, prompt, max_tokens=None, use_cache=True, model=None):
+    route = get_route(name)
+    model = model or route['model']
+    max_tokens = max_tokens or route['max_tokens']
+    key = LLMCache.make_key(model, max_tokens, prompt)
+    if use_cache:
+        cached = llm_cache.get(name, key)
+        if cached is not None:
+            return cached
+
+    async with inflight_slots():
+        message = await acreate_message(name, route, model, max_tokens, prompt)
+    text = message.content[0].text
+
+    if use_cache:
+        llm_cache.put(key, text)
+    return text
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def sse_response(events):
+    return Response(stream_with_context(events), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
-def parse_pptx(file_path):
+parse_executor = None
+parse_executor_lock = threading.Lock()
+
+def get_parse_executor():
+    # Created on first use so importing the app doesn't start worker processes
+    global parse_executor
+    with parse_executor_lock:
+        if parse_executor is None:
+            parse_executor = ProcessPoolExecutor(max_workers=app.config['PARSE_WORKERS'])
+    return parse_executor
+
+def page_ranges(page_count, workers):
+    # Two ranges per worker keeps them busy when some pages are much denser than others
+    size = max(1, -(-page_count // (workers * 2)))
+    return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+def extract_parallel(extract_range, file_path, page_count):
+    if page_count < app.config['PARSE_PARALLEL_MIN_PAGES'] or app.config['PARSE_WORKERS'] < 2:
+        return extract_range(file_path, 0, page_count)
+    
+    ranges = page_ranges(page_count, app.config['PARSE_WORKERS'])
+    executor = get_parse_executor()
+    futures = [executor.submit(extract_range, file_path, start, stop) for start, stop in ranges]
+    pages = []
+    for future in futures:
+        pages.extend(future.result())
+    return pages
+
+def extract_pptx_range(file_path, start, stop):
     prs = Presentation(file_path)
-    text = []
-    for slide in prs.slides:
-        for shape in slide.shapes:
+    slides = []
+    for index in range(start, stop):
+        text = []
+        for shape in prs.slides[index].shapes:
             if hasattr(shape, "text"):
                 text.append(shape.text)
-    return "\n".join(text)
+        slides.append("\n".join(text))
+    return slides
 
-def parse_pdf(file_path):
-    text = []
+def extract_pdf_range(file_path, start, stop):
     with open(file_path, 'rb') as file:
         reader = PyPDF2.PdfReader(file)
-        for page in reader.pages:
-            extracted = page.extract_text()
-            if extracted:
-                text.append(extracted)
-    return "\n".join(text)
+        return [reader.pages[index].extract_text() or '' for index in range(start, stop)]
 
-def parse_document(file_path):
+def parse_pptx_slides(file_path):
+    return extract_parallel(extract_pptx_range, file_path, len(Presentation(file_path).slides))
+
+def parse_pdf_pages(file_path):
+    with open(file_path, 'rb') as file:
+        page_count = len(PyPDF2.PdfReader(file).pages)
+    return extract_parallel(extract_pdf_range, file_path, page_count)
+
+def parse_document_pages(file_path):
+    # Text per slide/page, in document order
+    started = time.perf_counter()
     if file_path.endswith('.pptx'):
-        return parse_pptx(file_path)
+        pages = parse_pptx_slides(file_path)
     elif file_path.endswith('.pdf'):
-        return parse_pdf(file_path)
+        pages = parse_pdf_pages(file_path)
     else:
         raise ValueError("Unsupported file type")
+    metrics.observe('document_parse_duration_seconds', time.perf_counter() - started,
+                    type=file_path.rsplit('.', 1)[-1])
+    return pages
+
+def parse_pptx(file_path):
+    return "\n".join(text for text in parse_pptx_slides(file_path) if text)
 
-def extract_cv_info(cv_text):
-    prompt = f"""Analyze this CV and extract the key information.
+def parse_pdf(file_path):
+    return "\n".join(text for text in parse_pdf_pages(file_path) if text)
+
+def parse_document(file_path):
+    return "\n".join(text for text in parse_document_pages(file_path) if text)
+
+# Canonical name for common spellings and abbreviations, keyed by the casefolded form
+SKILL_ALIASES = {
+    'js': 'JavaScript', 'javascript': 'JavaScript', 'ecmascript': 'JavaScript',
+    'ts': 'TypeScript', 'typescript': 'TypeScript',
+    'py': 'Python', 'python': 'Python', 'python3': 'Python', 'python 3': 'Python',
+    'golang': 'Go', 'go': 'Go',
+    'c sharp': 'C#', 'c#': 'C#', 'cpp': 'C++', 'c++': 'C++',
+    'node': 'Node.js', 'nodejs': 'Node.js', 'node.js': 'Node.js', 'node js': 'Node.js',
+    'react': 'React', 'reactjs': 'React', 'react.js': 'React', 'react js': 'React',
+    'vue': 'Vue', 'vuejs': 'Vue', 'vue.js': 'Vue', 'angularjs': 'Angular', 'angular': 'Angular',
+    'postgres': 'PostgreSQL', 'postgresql': 'PostgreSQL', 'psql': 'PostgreSQL',
+    'mongo': 'MongoDB', 'mongodb': 'MongoDB', 'mysql': 'MySQL', 'sql': 'SQL',
+    'k8s': 'Kubernetes', 'kubernetes': 'Kubernetes', 'docker': 'Docker',
+    'aws': 'AWS', 'amazon web services': 'AWS', 'gcp': 'GCP', 'google cloud': 'GCP',
+    'google cloud platform': 'GCP', 'azure': 'Azure', 'microsoft azure': 'Azure',
+    'ml': 'Machine Learning', 'machine learning': 'Machine Learning',
+    'dl': 'Deep Learning', 'deep learning': 'Deep Learning',
+    'ai': 'Artificial Intelligence', 'artificial intelligence': 'Artificial Intelligence',
+    'nlp': 'Natural Language Processing', 'natural language processing': 'Natural Language Processing',
+    'sklearn': 'scikit-learn', 'scikit learn': 'scikit-learn', 'scikit-learn': 'scikit-learn',
+    'tensorflow': 'TensorFlow', 'pytorch': 'PyTorch', 'git': 'Git', 'github': 'GitHub',
+    'ci/cd': 'CI/CD', 'ci cd': 'CI/CD', 'cicd': 'CI/CD', 'continuous integration': 'CI/CD',
+    'rest': 'REST APIs', 'rest api': 'REST APIs', 'rest apis': 'REST APIs', 'restful apis': 'REST APIs',
+    'html': 'HTML', 'html5': 'HTML', 'css': 'CSS', 'css3': 'CSS',
+    'oop': 'Object-Oriented Programming', 'object oriented programming': 'Object-Oriented Programming',
+    'object-oriented programming': 'Object-Oriented Programming',
+    'problem-solving': 'Problem Solving', 'problem solving': 'Problem Solving',
+    'team work': 'Teamwork', 'teamwork': 'Teamwork', 'team-work': 'Teamwork',
+    'communication skills': 'Communication', 'communication': 'Communication'
+}
+# A skill listed under several keys is kept under the first of these only
+SKILL_PRIORITY = ['technical_skills', 'soft_skills', 'methodologies', 'tools', 'skills']
+# Least important last: generate_cv trims these first when the profile is over budget
+PROFILE_PRIORITY = ['technical_skills', 'projects', 'achievements', 'soft_skills', 'tools',
+                    'methodologies', 'skills', 'expertise_areas']
+
+def fold(text):
+    return ' '.join(text.casefold().split()).strip(' ,;:')
+
+def skill_key(skill):
+    folded = fold(skill)
+    return SKILL_ALIASES.get(folded, folded).casefold()
+
+def normalize_skills(skills, seen=None):
+    # Case-folds, resolves aliases and drops duplicates, keeping the first spelling seen
+    seen = set() if seen is None else seen
+    normalized = []
+    for skill in skills:
+        if not isinstance(skill, str):
+            continue
+        key = skill_key(skill)
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        normalized.append(SKILL_ALIASES.get(fold(skill), skill.strip()))
+    return normalized
+
+def dedupe_items(items):
+    seen = set()
+    unique = []
+    for item in items:
+        if isinstance(item, str) and fold(item) and fold(item) not in seen:
+            seen.add(fold(item))
+            unique.append(item.strip())
+    return unique
+
+def compact_profile(profile_data):
+    # profile_data is a profile dict or its JSON
+    if isinstance(profile_data, str):
+        try:
+            profile_data = json.loads(profile_data or '{}')
+        except ValueError:
+            profile_data = {}
+    seen = set()
+    compact = {key: normalize_skills(profile_data.get(key) or [], seen) for key in SKILL_PRIORITY}
+    for key in PROFILE_KEYS:
+        if key not in compact:
+            compact[key] = dedupe_items(profile_data.get(key) or [])
+    return compact
+
+def compact_text(text):
+    # Extracted PDF/PPTX text is full of trailing spaces and runs of blank lines
+    text = re.sub(r'[ \t]+', ' ', text or '')
+    text = re.sub(r' ?\n ?', '\n', text)
+    return re.sub(r'\n{3,}', '\n\n', text).strip()
+
+def section_tokens(value):
+    if isinstance(value, list):
+        return sum(estimate_tokens(item) for item in value)
+    return estimate_tokens(value) if value else 0
+
+def trim_section(value, max_tokens):
+    # Lists lose items from the end; text is cut back to a line break where there is one
+    if isinstance(value, list):
+        kept = []
+        used = 0
+        for item in value:
+            used += estimate_tokens(item)
+            if used > max_tokens:
+                break
+            kept.append(item)
+        return kept
+    text = value[:max(0, max_tokens - 1) * 4]
+    cut = text.rfind('\n')
+    return text[:cut] if cut > len(text) // 2 else text
+
+def fit_sections(name, sections):
+    """Trims prompt sections to the route's input_tokens budget.
+
+    sections is a list of (section, value) or (section, value, cap) tuples from
+    most to least important, where a value is text or a list of items. Sections
+    are first cut to their own cap, then the least important are trimmed until
+    the total fits.
+    """
+    budget = get_route(name)['input_tokens']
+    fitted = {}
+    for section, value, *cap in sections:
+        tokens = section_tokens(value)
+        if cap and tokens > cap[0]:
+            value = trim_section(value, cap[0])
+            metrics.inc('prompt_tokens_trimmed_total', tokens - section_tokens(value), function=name, section=section)
+        fitted[section] = value
+    if not budget:
+        return fitted
+    overflow = sum(section_tokens(value) for value in fitted.values()) - budget
+    for section in reversed(list(fitted)):
+        if overflow <= 0:
+            break
+        tokens = section_tokens(fitted[section])
+        fitted[section] = trim_section(fitted[section], tokens - overflow)
+        trimmed = tokens - section_tokens(fitted[section])
+        overflow -= trimmed
+        metrics.inc('prompt_tokens_trimmed_total', trimmed, function=name, section=section)
+    return fitted
+
+def build_cv_info_prompt(cv_text):
+    cv_text = fit_sections('extract_cv_info', [('cv', compact_text(cv_text))])['cv']
+    return f"""Analyze this CV and extract the key information.
 
 CV Content:
 {cv_text}
@@ -72,15 +1769,15 @@ Extract and return as JSON:
 
 Only include information clearly present. Return Not found for missing fields."""
 
-    message = client.messages.create(
-        model="claude-opus-4-20250514",
-        max_tokens=1500,
-        messages=[{"role": "user", "content": prompt}]
-    )
-    return message.content[0].text
+def extract_cv_info(cv_text, use_cache=True):
+    return call_model('extract_cv_info', build_cv_info_prompt(cv_text), use_cache=use_cache)
 
-def extract_profile(slide_text):
-    prompt = f"""Analyze this content extracted from presentation/lecture slides/project documents and identify professional information for a CV.
+async def aextract_cv_info(cv_text, use_cache=True):
+    return await acall_model('extract_cv_info', build_cv_info_prompt(cv_text), use_cache=use_cache)
+
+def build_profile_prompt(slide_text):
+    slide_text = fit_sections('extract_profile', [('content', compact_text(slide_text))])['content']
+    return f"""Analyze this content extracted from presentation/lecture slides/project documents and identify professional information for a CV.
 
 Content:
 {slide_text}
@@ -107,19 +1804,23 @@ Be VERY thorough with skill extraction:
 
 Return comprehensive lists without being conservative."""
 
-    message = client.messages.create(
-        model="claude-opus-4-20250514",
-        max_tokens=2000,
-        messages=[{"role": "user", "content": prompt}]
-    )
-    return message.content[0].text
+def extract_profile(slide_text, use_cache=True):
+    return Profile.from_model_output(call_model('extract_profile', build_profile_prompt(slide_text), use_cache=use_cache))
 
-def generate_cv(profile_data, user_info, source_cv=None):
+async def aextract_profile(slide_text, use_cache=True):
+    return Profile.from_model_output(await acall_model('extract_profile', build_profile_prompt(slide_text), use_cache=use_cache))
+
+def build_cv_prompt(profile_data, user_info, source_cv=None):
+    profile = compact_profile(profile_data)
+    fitted = fit_sections('generate_cv', [('source_cv', compact_text(source_cv))]
+                          + [(key, profile[key]) for key in PROFILE_PRIORITY])
+    profile_data = json.dumps({key: fitted[key] for key in PROFILE_KEYS if fitted[key]})
+    source_cv = fitted['source_cv']
     base_info = ""
     if source_cv:
         base_info = f"\n\nBase CV Information (use this as foundation):\n{source_cv}"
     
-    prompt = f"""Create a professional, well-formatted CV based on this extracted data:
+    return f"""Create a professional, well-formatted CV based on this extracted data:
 
 Profile Data: {profile_data}
 
@@ -140,23 +1841,28 @@ Create a complete CV with these sections:
 Use strong action verbs. Be specific and impactful.
 Format it cleanly with clear section headers."""
 
-    message = client.messages.create(
-        model="claude-opus-4-20250514",
-        max_tokens=2500,
-        messages=[{"role": "user", "content": prompt}]
-    )
-    return message.content[0].text
+def generate_cv(profile_data, user_info, source_cv=None, use_cache=True):
+    prompt = build_cv_prompt(profile_data, user_info, source_cv)
+    return call_model('generate_cv', prompt, use_cache=use_cache)
+
+async def agenerate_cv(profile_data, user_info, source_cv=None, use_cache=True):
+    prompt = build_cv_prompt(profile_data, user_info, source_cv)
+    return await acall_model('generate_cv', prompt, use_cache=use_cache)
 
-def tailor_cv_to_job(generic_cv, job_info):
-    prompt = f"""Tailor this CV to match the job description. Keep the same format but emphasize relevant skills and experience.
+def fit_job_sections(name, cv_data, job_info):
+    # The CV comes first so that only an oversized CV changes the cached prefix
+    fitted = fit_sections(name, [('cv', compact_text(cv_data)),
+                                 ('job_description', compact_text(job_info.get('description')))])
+    return fitted['cv'], fitted['job_description'] or 'Not provided'
 
-Generic CV:
-{generic_cv}
+def build_tailor_prompt(generic_cv, job_info):
+    generic_cv, description = fit_job_sections('tailor_cv_to_job', generic_cv, job_info)
+    return cached_prompt('tailor_cv_to_job', generic_cv, f"""Tailor the CV above to match the job description. Keep the same format but emphasize relevant skills and experience.
 
 Job Details:
 - Job Title: {job_info.get('title', 'Not specified')}
 - Company: {job_info.get('company', 'Not specified')}
-- Job Description: {job_info.get('description', 'Not provided')}
+- Job Description: {description}
 
 Instructions:
 1. Keep the same CV structure and format
@@ -166,25 +1872,24 @@ Instructions:
 5. Maintain all factual information from the original CV
 6. Use keywords from the job description naturally
 
-Return the complete tailored CV in the same format."""
+Return the complete tailored CV in the same format.""")
 
-    message = client.messages.create(
-        model="claude-opus-4-20250514",
-        max_tokens=3000,
-        messages=[{"role": "user", "content": prompt}]
-    )
-    return message.content[0].text
+def tailor_cv_to_job(generic_cv, job_info, use_cache=True):
+    prompt = build_tailor_prompt(generic_cv, job_info)
+    return call_model('tailor_cv_to_job', prompt, use_cache=use_cache)
 
-def generate_cover_letter(cv_data, job_info):
-    prompt = f"""Write a tailored, compelling cover letter.
+async def atailor_cv_to_job(generic_cv, job_info, use_cache=True):
+    prompt = build_tailor_prompt(generic_cv, job_info)
+    return await acall_model('tailor_cv_to_job', prompt, use_cache=use_cache)
 
-Candidate Profile:
-{cv_data}
+def build_cover_letter_prompt(cv_data, job_info):
+    cv_data, description = fit_job_sections('generate_cover_letter', cv_data, job_info)
+    return cached_prompt('generate_cover_letter', cv_data, f"""Write a tailored, compelling cover letter for the candidate above.
 
 Job Details:
 - Job Title: {job_info.get('title', 'Not specified')}
 - Company: {job_info.get('company', 'Not specified')}
-- Job Description: {job_info.get('description', 'Not provided')}
+- Job Description: {description}
 
 Write a cover letter that:
 1. Opens with an engaging hook (not I am writing to apply...)
@@ -193,25 +1898,206 @@ Write a cover letter that:
 4. Includes a concrete achievement example
 5. Ends with a confident call to action
 
-Length: 3-4 paragraphs. Tone: Professional but personable."""
-
-    message = client.messages.create(
-        model="claude-opus-4-20250514",
-        max_tokens=1500,
-        messages=[{"role": "user", "content": prompt}]
-    )
-    return message.content[0].text
-
-def analyze_job_match(cv_data, job_info):
-    prompt = f"""Analyze how well this candidate matches the job and provide a detailed compatibility assessment.
+Length: 3-4 paragraphs. Tone: Professional but personable.""")
+
+def generate_cover_letter(cv_data, job_info, use_cache=True):
+    prompt = build_cover_letter_prompt(cv_data, job_info)
+    return call_model('generate_cover_letter', prompt, use_cache=use_cache)
+
+async def agenerate_cover_letter(cv_data, job_info, use_cache=True):
+    prompt = build_cover_letter_prompt(cv_data, job_info)
+    return await acall_model('generate_cover_letter', prompt, use_cache=use_cache)
+
+COMMON_TECHNICAL_SKILLS = [
+    'python', 'java', 'javascript', 'typescript', 'c++', 'c#', 'go', 'rust', 'ruby', 'php',
+    'kotlin', 'swift', 'scala', 'r', 'matlab', 'sql', 'nosql', 'postgresql', 'mysql',
+    'mongodb', 'redis', 'html', 'css', 'react', 'angular', 'vue', 'node.js', 'django',
+    'flask', 'spring', '.net', 'aws', 'azure', 'gcp', 'docker', 'kubernetes', 'terraform',
+    'linux', 'git', 'ci/cd', 'jenkins', 'rest', 'graphql', 'microservices', 'machine learning',
+    'deep learning', 'tensorflow', 'pytorch', 'pandas', 'numpy', 'spark', 'hadoop', 'tableau',
+    'power bi', 'excel', 'agile', 'scrum', 'devops', 'unit testing', 'data analysis', 'statistics'
+]
+COMMON_SOFT_SKILLS = [
+    'communication', 'teamwork', 'leadership', 'problem solving', 'collaboration',
+    'time management', 'presentation', 'mentoring', 'stakeholder management', 'adaptability'
+]
+EDUCATION_TERMS = {'degree', 'bachelor', 'bachelors', 'master', 'masters', 'phd', 'bsc', 'msc',
+                   'ba', 'graduate', 'university', 'diploma'}
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'have', 'in', 'is',
+    'it', 'of', 'on', 'or', 'our', 'that', 'the', 'their', 'this', 'to', 'we', 'will', 'with',
+    'you', 'your', 'who', 'can', 'all', 'role', 'team', 'work', 'experience', 'years', 'including'
+}
 
-Candidate CV:
-{cv_data}
+def tokenize(text):
+    tokens = re.findall(r"[a-z0-9][a-z0-9+#./]*", (text or '').lower())
+    return [token.rstrip('./') for token in tokens if token.rstrip('./') not in STOPWORDS]
+
+def contains_phrase(text, phrase):
+    pattern = r'(?<![a-z0-9])' + re.escape(phrase) + r'(?![a-z0-9+#])'
+    return re.search(pattern, text) is not None
+
+def word_set(text):
+    return frozenset(re.findall(r'[a-z0-9]+', text))
+
+class PhraseMatcher:
+    """Finds which of a fixed set of phrases occur in a text.
+
+    A phrase can only occur if all of its alphanumeric words do, so each text
+    is split into words once and most phrases are ruled out by a set lookup.
+    The few left are confirmed with contains_phrase.
+    """
+
+    def __init__(self, phrases):
+        self.words = {phrase: word_set(phrase) for phrase in phrases}
+
+    def find(self, text):
+        words = word_set(text)
+        return {phrase for phrase, needed in self.words.items()
+                if needed <= words and contains_phrase(text, phrase)}
+
+COMMON_MATCHER = PhraseMatcher(COMMON_TECHNICAL_SKILLS + COMMON_SOFT_SKILLS)
+
+# Multi-word and punctuated skills that tokenizing alone would split up, longest first
+SKILL_PHRASE_PATTERN = re.compile(r'(?<![a-z0-9])(' + '|'.join(
+    re.escape(phrase) for phrase in sorted(
+        {phrase for phrase in list(SKILL_ALIASES) + COMMON_TECHNICAL_SKILLS + COMMON_SOFT_SKILLS
+         if not re.fullmatch(r'[a-z0-9]+', phrase)}, key=len, reverse=True)
+) + r')(?![a-z0-9+#])')
+
+def index_terms(text):
+    # Normalized skills and keywords for the job search index; queries go through
+    # the same function so "JS" finds jobs that say "JavaScript"
+    text = (text or '').lower()
+    terms = {skill_key(token) for token in tokenize(text)}
+    terms.update(skill_key(phrase) for phrase in SKILL_PHRASE_PATTERN.findall(text))
+    return terms
+
+def term_similarities(cv_text, job_texts):
+    # Cosine similarity of log-scaled, idf-weighted term vectors: row 0 is the CV
+    documents = [tokenize(cv_text)] + [tokenize(text) for text in job_texts]
+    vocabulary = {term: index for index, term in enumerate(sorted({t for doc in documents for t in doc}))}
+    if not vocabulary:
+        return np.zeros(len(job_texts))
+    
+    counts = np.zeros((len(documents), len(vocabulary)))
+    for row, doc in enumerate(documents):
+        np.add.at(counts[row], [vocabulary[term] for term in doc], 1)
+    
+    weights = np.where(counts > 0, 1 + np.log(np.maximum(counts, 1)), 0)
+    doc_freq = np.count_nonzero(counts, axis=0)
+    weights *= np.log((len(documents) + 1) / (doc_freq + 1)) + 1
+    norms = np.linalg.norm(weights, axis=1)
+    norms[norms == 0] = 1
+    weights /= norms[:, None]
+    return weights[1:] @ weights[0]
+
+def local_match_scores(cv_data, jobs, profile=None):
+    """Scores the CV against every job without calling the model.
+
+    Skills come from the merged profile plus any common skills named in the
+    CV; the result has the same keys as the analyze_job_match JSON.
+    """
+    profile = profile or MergedProfile()
+    cv_lower = (cv_data or '').lower()
+    technical = {skill.lower(): skill for skill in profile.get('technical_skills', 'tools', 'skills')}
+    soft = {skill.lower(): skill for skill in profile.get('soft_skills')}
+    in_cv = COMMON_MATCHER.find(cv_lower)
+    for skill in COMMON_TECHNICAL_SKILLS:
+        if skill not in technical and skill in in_cv:
+            technical[skill] = skill
+    for skill in COMMON_SOFT_SKILLS:
+        if skill not in soft and skill in in_cv:
+            soft[skill] = skill
+    matcher = PhraseMatcher(set(technical) | set(soft) | set(COMMON_TECHNICAL_SKILLS) | set(COMMON_SOFT_SKILLS))
+    
+    job_texts = [f"{job.get('title') or ''}\n{job.get('description') or ''}".lower() for job in jobs]
+    similarities = term_similarities(cv_lower, job_texts)
+    cv_has_education = bool(EDUCATION_TERMS & set(tokenize(cv_lower)))
+    
+    results = []
+    for job_text, similarity in zip(job_texts, similarities):
+        in_job = matcher.find(job_text)
+        matched_technical = [name for key, name in technical.items() if key in in_job]
+        matched_soft = [name for key, name in soft.items() if key in in_job]
+        missing_technical = [skill for skill in COMMON_TECHNICAL_SKILLS
+                             if skill not in technical and skill in in_job]
+        missing_soft = [skill for skill in COMMON_SOFT_SKILLS
+                        if skill not in soft and skill in in_job]
+        
+        def overlap(matched, missing):
+            total = len(matched) + len(missing)
+            return len(matched) / total if total else float(similarity)
+        
+        technical_fit = overlap(matched_technical, missing_technical)
+        soft_fit = overlap(matched_soft, missing_soft)
+        if EDUCATION_TERMS & set(tokenize(job_text)):
+            education_fit = 0.9 if cv_has_education else 0.4
+        else:
+            education_fit = 0.8
+        experience_fit = min(1.0, float(similarity) * 2)
+        
+        fit = 0.5 * technical_fit + 0.25 * experience_fit + 0.15 * soft_fit + 0.1 * education_fit
+        score = round(60 + 38 * fit)
+        matched = matched_technical + matched_soft
+        missing = missing_technical + missing_soft
+        results.append({
+            "match_score": score,
+            "matched_skills": matched[:6],
+            "missing_skills": missing[:4],
+            "matched_experience": [],
+            "key_requirements_met": matched[:3],
+            "gaps": missing[:4],
+            "recommendation": (
+                f"Strong overlap on {', '.join(matched[:3])}." if matched else "Few listed skills overlap with this role."
+            ) + (f" Consider building experience with {', '.join(missing[:2])}." if missing else ""),
+            "compatibility_breakdown": {
+                "technical_match": round(100 * technical_fit),
+                "experience_match": round(100 * experience_fit),
+                "education_match": round(100 * education_fit),
+                "soft_skills_match": round(100 * soft_fit)
+            },
+            "source": "local"
+        })
+    return results
+
+def score_job_match_local(cv_data, job_info, profile=None):
+    return local_match_scores(cv_data, [job_info], profile)[0]
+
+def plan_job_scoring(cv_data, jobs, mode=None, refine_top=None, profile=None):
+    # Returns (local results by job id, jobs to send to the model). Every job is
+    # scored locally first; hybrid mode only sends the best few to the model.
+    mode = mode or app.config['MATCH_MODE']
+    if mode not in ('local', 'hybrid'):
+        return {}, jobs
+    
+    results = dict(zip((job['id'] for job in jobs), local_match_scores(cv_data, jobs, profile)))
+    if mode == 'local':
+        return results, []
+    refine_top = app.config['MATCH_REFINE_TOP'] if refine_top is None else refine_top
+    ranked = sorted(jobs, key=lambda job: results[job['id']]['match_score'], reverse=True)[:refine_top]
+    for job in ranked:
+        del results[job['id']]
+    return results, ranked
+
+def local_match_gate(cv_data, job_info, mode=None, profile=None):
+    # mode: 'local' scores without the model, 'llm' always asks the model,
+    # 'hybrid' only asks the model when the local score is promising.
+    # Returns (local_result, ask_model)
+    mode = mode or app.config['MATCH_MODE']
+    if mode not in ('local', 'hybrid'):
+        return None, True
+    local_result = score_job_match_local(cv_data, job_info, profile)
+    return local_result, mode == 'hybrid' and local_result['match_score'] >= app.config['MATCH_REFINE_MIN_SCORE']
+
+def build_match_prompt(cv_data, job_info):
+    cv_data, description = fit_job_sections('analyze_job_match', cv_data, job_info)
+    return cached_prompt('analyze_job_match', cv_data, f"""Analyze how well the candidate above matches the job and provide a detailed compatibility assessment.
 
 Job Details:
 - Job Title: {job_info.get('title', 'Not specified')}
 - Company: {job_info.get('company', 'Not specified')}
-- Job Description: {job_info.get('description', 'Not provided')}
+- Job Description: {description}
 
 Return ONLY valid JSON (no other text) with this exact structure:
 {{
@@ -232,49 +2118,52 @@ Return ONLY valid JSON (no other text) with this exact structure:
 
 The match_score should be a number between 60-98 based on how well the candidate fits.
 List 3-6 matched skills and 2-4 missing skills.
-Include detailed compatibility breakdown."""
+Include detailed compatibility breakdown.""")
 
-    message = client.messages.create(
-        model="claude-opus-4-20250514",
-        max_tokens=800,
-        messages=[{"role": "user", "content": prompt}]
-    )
-    
-    response_text = message.content[0].text.strip()
-    
+def parse_match_result(response_text):
+    response_text = response_text.strip()
     try:
         start = response_text.find('{')
         end = response_text.rfind('}') + 1
         if start != -1 and end > start:
             json_str = response_text[start:end]
-            return json.loads(json_str)
+            result = json.loads(json_str)
+            result['source'] = 'llm'
+            metrics.inc('llm_json_parse_total', function='analyze_job_match', result='success')
+            return result
     except:
         pass
+    metrics.inc('llm_json_parse_total', function='analyze_job_match', result='failure')
+    return None
+
+def analyze_job_match(cv_data, job_info, use_cache=True, mode=None, profile=None):
+    local_result, ask_model = local_match_gate(cv_data, job_info, mode, profile)
+    if not ask_model:
+        return local_result
     
-    return {
-        "match_score": 75,
-        "matched_skills": ["Communication", "Problem Solving", "Technical Skills"],
-        "missing_skills": ["Specific tools may vary"],
-        "matched_experience": ["Relevant projects"],
-        "key_requirements_met": ["Basic qualifications"],
-        "gaps": ["Some specific tools"],
-        "recommendation": "Good potential match. Highlight relevant experience in your application.",
-        "compatibility_breakdown": {
-            "technical_match": 75,
-            "experience_match": 70,
-            "education_match": 80,
-            "soft_skills_match": 75
-        }
-    }
+    response_text = call_model('analyze_job_match', build_match_prompt(cv_data, job_info), use_cache=use_cache)
+    # Unparseable model output: fall back to the local estimate rather than a fixed score
+    return parse_match_result(response_text) or local_result or score_job_match_local(cv_data, job_info, profile)
+
+async def aanalyze_job_match(cv_data, job_info, use_cache=True, mode=None, profile=None):
+    local_result, ask_model = local_match_gate(cv_data, job_info, mode, profile)
+    if not ask_model:
+        return local_result
+    
+    response_text = await acall_model('analyze_job_match', build_match_prompt(cv_data, job_info), use_cache=use_cache)
+    return parse_match_result(response_text) or local_result or score_job_match_local(cv_data, job_info, profile)
 
-def search_recommended_jobs(cv_data, user_skills):
-    prompt = f"""Based on this candidate profile, recommend relevant job positions they should consider.
+def build_recommendations_prompt(cv_data, user_skills):
+    # Skills are the densest signal, but capped so a long list still leaves room for the CV
+    fitted = fit_sections('search_recommended_jobs', [('skills', normalize_skills(user_skills), 500),
+                                                      ('cv', compact_text(cv_data))])
+    return f"""Based on this candidate profile, recommend relevant job positions they should consider.
 
 Candidate CV Summary:
-{cv_data[:1500]}
+{fitted['cv']}
 
 Candidate Skills:
-{', '.join(user_skills[:50])}
+{', '.join(fitted['skills'])}
 
 Generate 8-10 realistic job recommendations. Return ONLY valid JSON:
 {{
@@ -292,39 +2181,311 @@ Generate 8-10 realistic job recommendations. Return ONLY valid JSON:
 
 Make recommendations realistic and diverse across different companies and seniority levels."""
 
-    message = client.messages.create(
-        model="claude-opus-4-20250514",
-        max_tokens=2000,
-        messages=[{"role": "user", "content": prompt}]
-    )
-    
-    response_text = message.content[0].text.strip()
-    
+def parse_recommendations(response_text):
+    response_text = response_text.strip()
     try:
         start = response_text.find('{')
         end = response_text.rfind('}') + 1
         if start != -1 and end > start:
             json_str = response_text[start:end]
-            return json.loads(json_str)
+            result = json.loads(json_str)
+            metrics.inc('llm_json_parse_total', function='search_recommended_jobs', result='success')
+            return result
     except:
         pass
     
+    metrics.inc('llm_json_parse_total', function='search_recommended_jobs', result='failure')
     return {"recommended_jobs": []}
 
-def save_cv_version(cv_content, description="Manual update"):
-    version = {
-        'cv': cv_content,
-        'description': description,
-        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'version_number': len(app_data.get('cv_versions', [])) + 1
-    }
+def search_recommended_jobs(cv_data, user_skills, use_cache=True):
+    prompt = build_recommendations_prompt(cv_data, user_skills)
+    return parse_recommendations(call_model('search_recommended_jobs', prompt, use_cache=use_cache))
+
+async def asearch_recommended_jobs(cv_data, user_skills, use_cache=True):
+    prompt = build_recommendations_prompt(cv_data, user_skills)
+    return parse_recommendations(await acall_model('search_recommended_jobs', prompt, use_cache=use_cache))
+
+# Async twin of each sync prompt function, used by submit_model_call in async mode
+ASYNC_VARIANTS = {
+    extract_cv_info: aextract_cv_info,
+    extract_profile: aextract_profile,
+    generate_cv: agenerate_cv,
+    tailor_cv_to_job: atailor_cv_to_job,
+    generate_cover_letter: agenerate_cover_letter,
+    analyze_job_match: aanalyze_job_match,
+    search_recommended_jobs: asearch_recommended_jobs
+}
+
+PROFILE_KEYS = ['skills', 'projects', 'achievements', 'tools', 'expertise_areas',
+                'technical_skills', 'soft_skills', 'methodologies']
+SKILL_KEYS = ['skills', 'technical_skills', 'soft_skills', 'tools', 'methodologies']
+
+class Profile:
+    """Profile extracted from a document, parsed and validated once.
+
+    Every key holds a deduplicated list of interned strings, so a skill that
+    appears in many documents is only stored once.
+    """
+
+    __slots__ = tuple(PROFILE_KEYS)
+
+    def __init__(self, **fields):
+        for key in PROFILE_KEYS:
+            values = fields.get(key)
+            if not isinstance(values, list):
+                values = []
+            setattr(self, key, list(dict.fromkeys(
+                sys.intern(item.strip()) if isinstance(item, str) else json.dumps(item, sort_keys=True)
+                for item in values
+                if item
+            )))
+
+    @classmethod
+    def from_model_output(cls, text):
+        data = {}
+        start = text.find('{') if text else -1
+        end = text.rfind('}') + 1 if text else 0
+        if start != -1 and end > start:
+            try:
+                data = json.loads(text[start:end])
+            except ValueError:
+                pass
+        if not isinstance(data, dict):
+            data = {}
+        return cls(**{key: data.get(key) for key in PROFILE_KEYS})
+
+    def to_dict(self):
+        return {key: list(getattr(self, key)) for key in PROFILE_KEYS}
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+    def copy(self):
+        profile = Profile.__new__(Profile)
+        for key in PROFILE_KEYS:
+            setattr(profile, key, list(getattr(self, key)))
+        return profile
+
+class MergedProfile:
+    """Union of the base profile and every enhancement, maintained incrementally.
+
+    Each item keeps a count of the sources that contributed it, so adding or
+    removing a source only touches that source's own items.
+    """
+
+    def __init__(self):
+        self.counts = {key: {} for key in PROFILE_KEYS}
+        self.sources = {}
+
+    def add_source(self, source_id, profile):
+        for key in PROFILE_KEYS:
+            for item in getattr(profile, key):
+                self.counts[key][item] = self.counts[key].get(item, 0) + 1
+        self.sources[source_id] = profile
+
+    def remove_source(self, source_id):
+        profile = self.sources.pop(source_id, None)
+        if profile is None:
+            return
+        for key in PROFILE_KEYS:
+            for item in getattr(profile, key):
+                remaining = self.counts[key].get(item, 0) - 1
+                if remaining > 0:
+                    self.counts[key][item] = remaining
+                else:
+                    self.counts[key].pop(item, None)
+
+    def discard(self, item, keys=SKILL_KEYS):
+        # Drops an item everywhere, including from the source profiles themselves
+        for profile in self.sources.values():
+            for key in keys:
+                items = getattr(profile, key)
+                if item in items:
+                    items.remove(item)
+        for key in keys:
+            self.counts[key].pop(item, None)
+
+    def copy(self):
+        merged = MergedProfile()
+        merged.counts = {key: dict(counts) for key, counts in self.counts.items()}
+        merged.sources = {source_id: profile.copy() for source_id, profile in self.sources.items()}
+        return merged
+
+    def get(self, *keys):
+        items = {}
+        for key in keys:
+            items.update(dict.fromkeys(self.counts[key]))
+        return list(items)
+
+    def to_dict(self):
+        return {key: list(self.counts[key]) for key in PROFILE_KEYS}
+
+    def to_state(self):
+        return {'sources': {source_id: profile.to_dict() for source_id, profile in self.sources.items()}}
+
+    @classmethod
+    def from_state(cls, state):
+        merged = cls()
+        for source_id, data in state.get('sources', {}).items():
+            merged.add_source(source_id, Profile(**data))
+        return merged
+
+# Separate from llm_executor: chunked extraction already runs inside that pool
+chunk_executor = ThreadPoolExecutor(max_workers=app.config['PROFILE_CHUNK_CONCURRENCY'])
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+def chunk_pages(pages, budget_tokens):
+    # Packs whole slides/pages into chunks of at most budget_tokens; an oversized
+    # page is split on line boundaries
+    pieces = []
+    for page in pages:
+        if estimate_tokens(page) <= budget_tokens:
+            pieces.append(page)
+            continue
+        piece = []
+        for line in page.split('\n'):
+            if piece and estimate_tokens('\n'.join(piece + [line])) > budget_tokens:
+                pieces.append('\n'.join(piece))
+                piece = []
+            piece.append(line)
+        pieces.append('\n'.join(piece))
     
-    if 'cv_versions' not in app_data:
-        app_data['cv_versions'] = []
+    chunks = []
+    current = []
+    current_tokens = 0
+    for piece in pieces:
+        tokens = estimate_tokens(piece)
+        if current and current_tokens + tokens > budget_tokens:
+            chunks.append('\n'.join(current))
+            current = []
+            current_tokens = 0
+        current.append(piece)
+        current_tokens += tokens
+    if current:
+        chunks.append('\n'.join(current))
+    return chunks
+
+def extract_profile_chunked(pages, use_cache=True):
+    pages = [page for page in pages if page]
+    chunks = chunk_pages(pages, app.config['PROFILE_CHUNK_TOKENS'])
+    if len(chunks) <= 1:
+        return run_model_call(extract_profile, '\n'.join(pages), use_cache)
     
-    app_data['cv_versions'].append(version)
-    app_data['current_cv_index'] = len(app_data['cv_versions']) - 1
-    app_data['cv'] = cv_content
+    # chunk_executor bounds the chunks in sync mode, the semaphore in async mode
+    slots = asyncio.Semaphore(app.config['PROFILE_CHUNK_CONCURRENCY'])
+    futures = [submit_model_call(extract_profile, chunk, use_cache, executor=chunk_executor, slots=slots)
+               for chunk in chunks]
+    profiles = [future.result() for future in futures]
+    return Profile(**{key: [item for profile in profiles for item in getattr(profile, key)]
+                      for key in PROFILE_KEYS})
+
+def save_cv_version(user_id, cv_content, description="Manual update"):
+    version_number = store.add_cv_version(user_id, cv_content, description)
+    store.set_state(user_id, cv=cv_content, current_version=version_number)
+
+def save_upload(file):
+    # Prefix with a random id so concurrent uploads with the same name don't clash
+    filename = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    file.save(file_path)
+    return file_path
+
+def process_cv_upload(file_path):
+    try:
+        cv_text = parse_document(file_path)
+        return 'cv', (cv_text, run_model_call(extract_cv_info, cv_text))
+    finally:
+        os.remove(file_path)
+
+def process_slides_upload(file_path):
+    try:
+        pages = parse_document_pages(file_path)
+        return 'slides', extract_profile_chunked(pages)
+    finally:
+        os.remove(file_path)
+
+def run_upload_pipeline(report, user_id, cv_path, slides_path, user_info, stream=False):
+    cv_text = None
+    profile_data = None
+    
+    # Both pipelines are independent until generate_cv, so run them side by side
+    calls = []
+    if cv_path:
+        calls.append((process_cv_upload, cv_path))
+    if slides_path:
+        calls.append((process_slides_upload, slides_path))
+    
+    report(10, 'Reading your documents')
+    for kind, result in run_parallel(*calls):
+        if kind == 'cv':
+            cv_text, cv_info = result
+            try:
+                cv_data = json.loads(cv_info)
+                if not user_info['name'] or user_info['name'] == '':
+                    user_info['name'] = cv_data.get('name', '')
+                if not user_info['email'] or user_info['email'] == '':
+                    user_info['email'] = cv_data.get('email', '')
+                if not user_info['phone'] or user_info['phone'] == '':
+                    user_info['phone'] = cv_data.get('phone', '')
+                if not user_info['target_role'] or user_info['target_role'] == '':
+                    user_info['target_role'] = cv_data.get('current_role', '')
+            except:
+                pass
+        else:
+            profile_data = result
+    
+    if stream:
+        # The CV itself is generated by /stream/cv while results.html renders it
+        store.set_state(user_id, pending_cv={
+            'profile_data': profile_data.to_json() if profile_data else "{}",
+            'user_info': user_info,
+            'source_cv': cv_text
+        })
+    else:
+        report(60, 'Writing your CV')
+        cv = run_model_call(generate_cv, profile_data.to_json() if profile_data else "{}", user_info, cv_text)
+        
+        store.delete_state(user_id, 'pending_cv')
+        store.clear_cv_versions(user_id)
+        save_cv_version(user_id, cv, "Initial CV generation")
+    
+    merged_profile = MergedProfile()
+    if profile_data:
+        merged_profile.add_source('base', profile_data)
+    
+    store.save_profile(user_id, merged_profile)
+    store.clear_enhancements(user_id)
+    store.set_state(user_id, user_info=user_info, source_cv=cv_text)
+    
+    return {'redirect': 'results' if stream else 'dashboard'}
+
+def run_enhancement_pipeline(report, user_id, file_path, filename):
+    try:
+        report(10, f'Reading {filename}')
+        pages = parse_document_pages(file_path)
+        content = "\n".join(page for page in pages if page)
+        report(40, 'Extracting skills')
+        profile_data = extract_profile_chunked(pages)
+    finally:
+        os.remove(file_path)
+    
+    enhancement_id = uuid.uuid4().hex
+    store.add_enhancement(user_id, enhancement_id, filename, content)
+    store.update_profile(user_id, lambda profile: profile.add_source(enhancement_id, profile_data))
+    
+    report(70, 'Updating your CV')
+    regenerate_enhanced_cv(user_id)
+    
+    return {'message': f'Successfully added {filename} to your profile!', 'redirect': 'enhance_profile'}
+
+def task_accepted(task_id):
+    return jsonify({
+        'success': True,
+        'task_id': task_id,
+        'status_url': url_for('task_status', task_id=task_id)
+    }), 202
 
 @app.route('/')
 def index():
@@ -346,58 +2507,23 @@ def upload():
         'target_role': request.form.get('target_role')
     }
     
-    cv_text = None
-    profile_data = None
+    stream = bool(request.form.get('stream'))
+    user_id = current_user()
     
     try:
-        if has_cv:
-            cv_file = request.files['cv_file']
-            if allowed_file(cv_file.filename):
-                filename = secure_filename(cv_file.filename)
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                cv_file.save(file_path)
-                
-                cv_text = parse_document(file_path)
-                cv_info = extract_cv_info(cv_text)
-                
-                try:
-                    cv_data = json.loads(cv_info)
-                    if not user_info['name'] or user_info['name'] == '':
-                        user_info['name'] = cv_data.get('name', '')
-                    if not user_info['email'] or user_info['email'] == '':
-                        user_info['email'] = cv_data.get('email', '')
-                    if not user_info['phone'] or user_info['phone'] == '':
-                        user_info['phone'] = cv_data.get('phone', '')
-                    if not user_info['target_role'] or user_info['target_role'] == '':
-                        user_info['target_role'] = cv_data.get('current_role', '')
-                except:
-                    pass
-                
-                os.remove(file_path)
-        
-        if has_slides:
-            slides_file = request.files['slides_file']
-            if allowed_file(slides_file.filename):
-                filename = secure_filename(slides_file.filename)
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                slides_file.save(file_path)
-                
-                slide_text = parse_document(file_path)
-                profile_data = extract_profile(slide_text)
-                
-                os.remove(file_path)
+        cv_path = None
+        slides_path = None
+        if has_cv and allowed_file(request.files['cv_file'].filename):
+            cv_path = save_upload(request.files['cv_file'])
+        if has_slides and allowed_file(request.files['slides_file'].filename):
+            slides_path = save_upload(request.files['slides_file'])
         
-        cv = generate_cv(profile_data or "{}", user_info, cv_text)
+        if request.form.get('async'):
+            task_id = task_runner.submit('upload', run_upload_pipeline, user_id, cv_path, slides_path, user_info, stream, user_id=user_id)
+            return task_accepted(task_id)
         
-        app_data['cv_versions'] = []
-        save_cv_version(cv, "Initial CV generation")
-        
-        app_data['profile'] = profile_data
-        app_data['user_info'] = user_info
-        app_data['source_cv'] = cv_text
-        app_data['enhancements'] = []
-        
-        return redirect(url_for('dashboard'))
+        result = run_upload_pipeline(no_progress, user_id, cv_path, slides_path, user_info, stream)
+        return redirect(url_for(result['redirect']))
         
     except Exception as e:
         flash(f'Error processing file: {str(e)}', 'error')
@@ -405,52 +2531,20 @@ def upload():
 
 @app.route('/dashboard')
 def dashboard():
-    if 'cv' not in app_data:
+    user_id = current_user()
+    if not store.has_state(user_id, 'cv'):
         return redirect(url_for('index'))
+    state = store.get_state(user_id, 'user_info', 'current_version')
     
+    merged_profile = store.load_profile(user_id)
     all_skills = {
-        'technical': set(),
-        'soft': set(),
-        'tools': set(),
-        'methodologies': set(),
-        'all': set()
+        'technical': set(merged_profile.get('technical_skills')),
+        'soft': set(merged_profile.get('soft_skills')),
+        'tools': set(merged_profile.get('tools')),
+        'methodologies': set(merged_profile.get('methodologies')),
+        'all': set(merged_profile.get(*SKILL_KEYS))
     }
     
-    # Get skills from original profile
-    if 'profile' in app_data and app_data['profile']:
-        try:
-            profile = json.loads(app_data['profile'])
-            # Add all skill types to 'all' category
-            all_skills['all'].update(profile.get('skills', []))
-            all_skills['technical'].update(profile.get('technical_skills', []))
-            all_skills['soft'].update(profile.get('soft_skills', []))
-            all_skills['tools'].update(profile.get('tools', []))
-            all_skills['methodologies'].update(profile.get('methodologies', []))
-            all_skills['all'].update(profile.get('technical_skills', []))
-            all_skills['all'].update(profile.get('soft_skills', []))
-            all_skills['all'].update(profile.get('tools', []))
-            all_skills['all'].update(profile.get('methodologies', []))
-        except Exception as e:
-            print(f"Error parsing profile: {e}")
-            print(f"Profile data: {app_data.get('profile', 'None')}")
-    
-    # Get skills from enhancements
-    if 'enhancements' in app_data:
-        for enhancement in app_data['enhancements']:
-            try:
-                profile = json.loads(enhancement['profile'])
-                all_skills['all'].update(profile.get('skills', []))
-                all_skills['technical'].update(profile.get('technical_skills', []))
-                all_skills['soft'].update(profile.get('soft_skills', []))
-                all_skills['tools'].update(profile.get('tools', []))
-                all_skills['methodologies'].update(profile.get('methodologies', []))
-                all_skills['all'].update(profile.get('technical_skills', []))
-                all_skills['all'].update(profile.get('soft_skills', []))
-                all_skills['all'].update(profile.get('tools', []))
-                all_skills['all'].update(profile.get('methodologies', []))
-            except Exception as e:
-                print(f"Error parsing enhancement: {e}")
-    
     # Combine all unique skills
     combined_skills = all_skills['all']
     
@@ -462,7 +2556,7 @@ def dashboard():
     print(f"Methodologies: {len(all_skills['methodologies'])}")
     
     return render_template('dashboard.html',
-                         user_info=app_data.get('user_info'),
+                         user_info=state.get('user_info'),
                          skills=sorted(list(combined_skills)),
                          skills_by_category={
                              'technical': sorted(list(all_skills['technical'])),
@@ -470,23 +2564,25 @@ def dashboard():
                              'tools': sorted(list(all_skills['tools'])),
                              'methodologies': sorted(list(all_skills['methodologies']))
                          },
-                         enhancement_count=len(app_data.get('enhancements', [])),
-                         job_count=len(saved_jobs),
-                         cv_version=app_data.get('current_cv_index', 0) + 1,
-                         total_versions=len(app_data.get('cv_versions', [])))
+                         enhancement_count=store.count_enhancements(user_id),
+                         job_count=store.count_jobs(user_id),
+                         cv_version=state.get('current_version', 1),
+                         total_versions=store.count_cv_versions(user_id))
 
 @app.route('/enhance-profile')
 def enhance_profile():
-    if 'cv' not in app_data:
+    user_id = current_user()
+    if not store.has_state(user_id, 'cv'):
         flash('Please generate your base CV first', 'error')
         return redirect(url_for('index'))
     return render_template('enhance_profile.html', 
-                         user_info=app_data.get('user_info'),
-                         enhancements=app_data.get('enhancements', []))
+                         user_info=store.get_state(user_id, 'user_info').get('user_info'),
+                         enhancements=store.list_enhancements(user_id))
 
 @app.route('/enhance-profile/upload', methods=['POST'])
 def upload_enhancement():
-    if 'cv' not in app_data:
+    user_id = current_user()
+    if not store.has_state(user_id, 'cv'):
         flash('Please generate your base CV first', 'error')
         return redirect(url_for('index'))
     
@@ -501,28 +2597,15 @@ def upload_enhancement():
     
     if file and allowed_file(file.filename):
         try:
-            filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
+            file_path = save_upload(file)
             
-            content = parse_document(file_path)
-            profile_data = extract_profile(content)
+            if request.form.get('async'):
+                task_id = task_runner.submit('enhancement', run_enhancement_pipeline, user_id, file_path, file.filename, user_id=user_id)
+                return task_accepted(task_id)
             
-            if 'enhancements' not in app_data:
-                app_data['enhancements'] = []
+            result = run_enhancement_pipeline(no_progress, user_id, file_path, file.filename)
             
-            app_data['enhancements'].append({
-                'filename': file.filename,
-                'content': content,
-                'profile': profile_data,
-                'date_added': datetime.now().strftime('%Y-%m-%d %H:%M')
-            })
-            
-            regenerate_enhanced_cv()
-            
-            os.remove(file_path)
-            
-            flash(f'Successfully added {file.filename} to your profile!', 'success')
+            flash(result['message'], 'success')
             return redirect(url_for('enhance_profile'))
             
         except Exception as e:
@@ -534,146 +2617,399 @@ def upload_enhancement():
 
 @app.route('/enhance-profile/remove/<int:index>', methods=['POST'])
 def remove_enhancement(index):
-    if 'enhancements' in app_data and 0 <= index < len(app_data['enhancements']):
-        removed = app_data['enhancements'].pop(index)
-        regenerate_enhanced_cv()
+    user_id = current_user()
+    removed = store.remove_enhancement(user_id, index) if index >= 0 else None
+    if removed:
+        store.update_profile(user_id, lambda profile: profile.remove_source(removed['id']))
+        regenerate_enhanced_cv(user_id)
         return jsonify({'success': True, 'message': f'Removed {removed["filename"]}'})
     
     return jsonify({'success': False, 'message': 'Enhancement not found'}), 404
 
-def regenerate_enhanced_cv():
-    all_profiles = []
-    
-    if 'profile' in app_data and app_data['profile']:
-        all_profiles.append(app_data['profile'])
-    
-    if 'enhancements' in app_data:
-        for enhancement in app_data['enhancements']:
-            all_profiles.append(enhancement['profile'])
-    
-    combined_profile = {
-        'skills': [],
-        'projects': [],
-        'achievements': [],
-        'tools': [],
-        'expertise_areas': [],
-        'technical_skills': [],
-        'soft_skills': [],
-        'methodologies': []
-    }
-    
-    for profile_str in all_profiles:
-        try:
-            profile = json.loads(profile_str)
-            for key in combined_profile.keys():
-                if key in profile:
-                    combined_profile[key].extend(profile[key])
-        except:
-            pass
-    
-    for key in combined_profile.keys():
-        seen = set()
-        unique_list = []
-        for item in combined_profile[key]:
-            if item not in seen:
-                seen.add(item)
-                unique_list.append(item)
-        combined_profile[key] = unique_list
+def regenerate_enhanced_cv(user_id):
+    state = store.get_state(user_id, 'user_info', 'source_cv')
+    combined_profile = store.load_profile(user_id).to_dict()
     
-    enhanced_cv = generate_cv(
+    enhanced_cv = run_model_call(
+        generate_cv,
         json.dumps(combined_profile),
-        app_data.get('user_info', {}),
-        app_data.get('source_cv')
+        state.get('user_info', {}),
+        state.get('source_cv')
     )
     
-    enhancement_files = [e['filename'] for e in app_data.get('enhancements', [])]
+    enhancement_files = [e['filename'] for e in store.list_enhancements(user_id)]
     description = f"Enhanced with: {', '.join(enhancement_files[-3:])}" if enhancement_files else "Profile enhancement"
-    save_cv_version(enhanced_cv, description)
-    
-    app_data['combined_profile'] = combined_profile
+    save_cv_version(user_id, enhanced_cv, description)
 
 @app.route('/results')
 def results():
-    if 'cv' not in app_data:
+    user_id = current_user()
+    # A pending CV replaces the saved one, so don't prefill the old text
+    stream = store.has_state(user_id, 'pending_cv')
+    state = store.get_state(user_id, 'user_info') if stream else store.get_state(user_id, 'cv', 'user_info')
+    if not stream and 'cv' not in state:
         return redirect(url_for('index'))
     return render_template('results.html', 
-                         cv=app_data.get('cv'),
-                         profile=app_data.get('profile'),
-                         user_info=app_data.get('user_info'))
+                         cv=state.get('cv', ''),
+                         profile=store.load_profile(user_id).sources.get('base'),
+                         user_info=state.get('user_info'),
+                         stream=stream)
+
+@app.route('/stream/cv')
+def stream_cv():
+    user_id = current_user()
+    pending = store.get_state(user_id, 'pending_cv').get('pending_cv')
+    if not pending:
+        return jsonify({'success': False, 'message': 'No CV generation pending'}), 404
+    
+    def events():
+        chunks = []
+        try:
+            prompt = build_cv_prompt(pending['profile_data'], pending['user_info'], pending['source_cv'])
+            for text in stream_model('generate_cv', prompt):
+                chunks.append(text)
+                yield sse('cv', text)
+        except Exception as e:
+            yield sse('error', str(e))
+            return
+        
+        store.delete_state(user_id, 'pending_cv')
+        store.clear_cv_versions(user_id)
+        save_cv_version(user_id, ''.join(chunks), "Initial CV generation")
+        yield sse('done', {})
+    
+    return sse_response(events())
+
+def number_arg(args, key, default=None, low=None, high=None):
+    # An integer query parameter clamped to [low, high]; default if missing or malformed
+    try:
+        value = int(args.get(key))
+    except (TypeError, ValueError):
+        return default
+    if low is not None:
+        value = max(low, value)
+    if high is not None:
+        value = min(high, value)
+    return value
+
+def job_filters(args):
+    # Search parameters shared by the jobs page and /jobs/search
+    applied = args.get('applied')
+    terms = set()
+    for text in [args.get('q')] + args.getlist('skill'):
+        terms |= index_terms(text)
+    return {
+        'terms': sorted(terms),
+        'company': (args.get('company') or '').strip() or None,
+        'applied': {'yes': True, '1': True, 'no': False, '0': False}.get(applied),
+        'min_score': number_arg(args, 'min_score'),
+        'max_score': number_arg(args, 'max_score'),
+        'sort': args.get('sort')
+    }
 
 @app.route('/jobs')
 def jobs_manager():
-    return render_template('jobs.html', jobs=saved_jobs)
+    user_id = current_user()
+    cv = store.get_state(user_id, 'cv').get('cv')
+    page = number_arg(request.args, 'page', 1, low=1)
+    page_size = app.config['JOBS_PAGE_SIZE']
+    jobs, total = store.search_jobs(user_id, **job_filters(request.args),
+                                    limit=page_size, offset=(page - 1) * page_size)
+    
+    # Instant local estimates for jobs on this page that haven't been scored by the model yet
+    estimates = {}
+    unscored = [job for job in jobs if not job.get('match_score')]
+    if cv and unscored:
+        for job, result in zip(unscored, local_match_scores(cv, unscored, store.load_profile(user_id))):
+            estimates[job['id']] = result['match_score']
+    
+    if request.args.get('sort') == 'score':
+        jobs = sorted(jobs, key=lambda j: j.get('match_score') or estimates.get(j['id'], 0), reverse=True)
+    filters = {key: value for key, value in request.args.items() if key != 'page' and value}
+    return render_template('jobs.html', jobs=jobs, estimates=estimates, sort=request.args.get('sort'),
+                           total=total, page=page, pages=max(1, -(-total // page_size)), filters=filters,
+                           all_jobs=store.count_jobs(user_id))
+
+@app.route('/jobs/search')
+def search_jobs():
+    # e.g. /jobs/search?skill=python&skill=docker&company=acme&applied=no&min_score=70&sort=score
+    user_id = current_user()
+    limit = number_arg(request.args, 'limit', 50, low=1, high=500)
+    offset = number_arg(request.args, 'offset', 0, low=0)
+    jobs, total = store.search_jobs(user_id, **job_filters(request.args), limit=limit, offset=offset)
+    return jsonify({'success': True, 'total': total, 'offset': offset, 'jobs': [
+        {key: job[key] for key in ('id', 'title', 'company', 'date_added', 'applied', 'match_score')}
+        for job in jobs
+    ]})
+
+def cv_fingerprint(cv):
+    return hashlib.sha256(cv.encode('utf-8')).hexdigest()[:16]
+
+def run_batch_scoring(report, user_id, cv, force=False):
+    fingerprint = cv_fingerprint(cv)
+    jobs = store.list_jobs(user_id)
+    pending = [job for job in jobs if force or job.get('scored_cv') != fingerprint]
+    skipped = len(jobs) - len(pending)
+    if not pending:
+        return {'scored': 0, 'failed': 0, 'skipped': skipped, 'redirect': 'jobs_manager'}
+    
+    report(0, f'Scoring {len(pending)} jobs')
+    profile = store.load_profile(user_id)
+    local_results, model_jobs = plan_job_scoring(cv, pending, profile=profile)
+    for job_id, result in local_results.items():
+        store.update_job(user_id, job_id, match_result=result, match_score=result['match_score'], scored_cv=fingerprint)
+    done = len(local_results)
+    failed = 0
+    # The pool bounds the calls in sync mode, the semaphore on the model loop in async mode
+    slots = asyncio.Semaphore(app.config['BATCH_SCORE_CONCURRENCY'])
+    with ThreadPoolExecutor(max_workers=app.config['BATCH_SCORE_CONCURRENCY']) as pool:
+        futures = {submit_model_call(analyze_job_match, cv, job, True, 'llm', profile, executor=pool, slots=slots): job
+                   for job in model_jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                result = future.result()
+                store.update_job(user_id, job['id'],
+                                 match_result=result,
+                                 match_score=result.get('match_score', 0),
+                                 scored_cv=fingerprint)
+            except Exception:
+                failed += 1
+            done += 1
+            report(round(100 * done / len(pending)), f'Scored {done} of {len(pending)} jobs')
+    
+    return {'scored': done - failed, 'failed': failed, 'skipped': skipped, 'redirect': 'jobs_manager'}
+
+@app.route('/jobs/score-all', methods=['POST'])
+def score_all_jobs():
+    user_id = current_user()
+    cv = store.get_state(user_id, 'cv').get('cv')
+    if not cv:
+        return jsonify({'success': False, 'message': 'Please generate your base CV first'}), 400
+    
+    data = request.get_json(silent=True) or {}
+    task_id = task_runner.submit('batch_score', run_batch_scoring, user_id, cv, bool(data.get('force')), user_id=user_id)
+    return task_accepted(task_id)
 
 @app.route('/jobs/add', methods=['POST'])
 def add_job():
-    job = {
-        'id': len(saved_jobs) + 1,
-        'title': request.form.get('job_title'),
-        'company': request.form.get('company'),
-        'description': request.form.get('job_description'),
-        'date_added': datetime.now().strftime('%Y-%m-%d %H:%M'),
-        'applied': False
-    }
-    saved_jobs.append(job)
+    store.add_job(current_user(),
+                  title=request.form.get('job_title'),
+                  company=request.form.get('company'),
+                  description=request.form.get('job_description'))
     flash('Job description saved successfully!', 'success')
     return redirect(url_for('jobs_manager'))
 
+IMPORT_FORMATS = {'csv': 'csv', 'jsonl': 'jsonl', 'ndjson': 'jsonl'}
+# Accepted column/key names for each job field, and the longest value allowed
+IMPORT_COLUMNS = {
+    'title': ('title', 'job_title', 'position'),
+    'company': ('company', 'company_name', 'employer'),
+    'description': ('description', 'job_description', 'details')
+}
+IMPORT_LIMITS = {'title': 300, 'company': 200, 'description': 50000}
+
+def read_job_rows(f, fmt):
+    # Yields (line number, row) one at a time, so the file is never held in memory
+    if fmt == 'csv':
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError:
+            yield line_number, None
+
+def validate_job_row(row):
+    # Returns (job, None) or (None, reason)
+    if not isinstance(row, dict):
+        return None, 'not a JSON object'
+    # "Job Title", "job-title" and "job_title" are all the same column
+    values = {re.sub(r'[\s-]+', '_', str(key).strip().lower()): value for key, value in row.items() if key is not None}
+    job = {}
+    for field, names in IMPORT_COLUMNS.items():
+        value = next((values[name] for name in names if values.get(name) not in (None, '')), '')
+        value = str(value).strip()
+        if len(value) > IMPORT_LIMITS[field]:
+            return None, f'{field} is longer than {IMPORT_LIMITS[field]} characters'
+        job[field] = value
+    if not job['title'] or not job['description']:
+        return None, 'title and description are required'
+    return job, None
+
+def import_jobs(report, user_id, file_path, fmt, batch_size=None):
+    # Each batch looks up its hashes in one query, and SQLite caps bound parameters
+    batch_size = min(batch_size or app.config['JOB_IMPORT_BATCH_SIZE'], 10000)
+    stats = {'rows': 0, 'imported': 0, 'duplicates': 0, 'invalid': 0, 'errors': []}
+    size = os.path.getsize(file_path) or 1
+    started = time.perf_counter()
+    batch = []
+    
+    def flush():
+        added = store.add_jobs(user_id, batch)
+        stats['imported'] += added
+        stats['duplicates'] += len(batch) - added
+        batch.clear()
+    
+    with open(file_path, encoding='utf-8-sig', newline='') as f:
+        try:
+            for line_number, row in read_job_rows(f, fmt):
+                stats['rows'] += 1
+                job, error = validate_job_row(row)
+                if error:
+                    stats['invalid'] += 1
+                    if len(stats['errors']) < 20:
+                        stats['errors'].append(f'line {line_number}: {error}')
+                    continue
+                job['content_hash'] = job_hash(job)
+                batch.append(job)
+                if len(batch) >= batch_size:
+                    flush()
+                    report(min(99, round(100 * f.buffer.tell() / size)),
+                           f"Imported {stats['imported']} of {stats['rows']} rows")
+        except (csv.Error, UnicodeDecodeError) as e:
+            # Rows before the bad one are kept
+            stats['errors'].append(f"stopped after row {stats['rows']}: {e}")
+        if batch:
+            flush()
+    
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    stats['rows_per_second'] = round(stats['rows'] / stats['seconds']) if stats['seconds'] else stats['rows']
+    for result in ('imported', 'duplicates', 'invalid'):
+        metrics.inc('job_import_rows_total', stats[result], result=result)
+    return stats
+
+def run_job_import(report, user_id, file_path, fmt):
+    try:
+        stats = import_jobs(report, user_id, file_path, fmt)
+    finally:
+        os.remove(file_path)
+    stats['message'] = (f"Imported {stats['imported']} jobs ({stats['duplicates']} duplicates, "
+                        f"{stats['invalid']} invalid) at {stats['rows_per_second']} rows/s")
+    stats['redirect'] = 'jobs_manager'
+    return stats
+
+@app.route('/jobs/import', methods=['POST'])
+def import_jobs_file():
+    user_id = current_user()
+    file = request.files.get('file')
+    if not file or not file.filename:
+        return jsonify({'success': False, 'message': 'No file selected'}), 400
+    extension = file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else ''
+    fmt = IMPORT_FORMATS.get(request.form.get('format') or extension)
+    if not fmt:
+        return jsonify({'success': False, 'message': 'Please upload a .csv or .jsonl file'}), 400
+    
+    file_path = save_upload(file)
+    if request.form.get('async'):
+        task_id = task_runner.submit('job_import', run_job_import, user_id, file_path, fmt, user_id=user_id)
+        return task_accepted(task_id)
+    return jsonify({'success': True, **run_job_import(no_progress, user_id, file_path, fmt)})
+
+@app.cli.command('import-jobs')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user', 'user_id', required=True, help='Session user id to import into, as shown by /debug')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension')
+@click.option('--batch-size', type=int, help='Rows per insert transaction')
+def import_jobs_command(path, user_id, fmt, batch_size):
+    """Stream a CSV or JSONL file of job postings into a user's saved jobs."""
+    fmt = fmt or IMPORT_FORMATS.get(path.rsplit('.', 1)[-1].lower())
+    if not fmt:
+        raise click.UsageError('Unknown file type; pass --format csv or --format jsonl')
+    stats = import_jobs(lambda progress, message: click.echo(f'{progress:3d}% {message}'),
+                        user_id, path, fmt, batch_size)
+    for error in stats['errors']:
+        click.echo(f'  {error}', err=True)
+    click.echo(f"{stats['rows']} rows in {stats['seconds']}s ({stats['rows_per_second']} rows/s): "
+               f"{stats['imported']} imported, {stats['duplicates']} duplicates, {stats['invalid']} invalid")
+
 @app.route('/jobs/delete/<int:job_id>', methods=['POST'])
 def delete_job(job_id):
-    global saved_jobs
-    saved_jobs = [j for j in saved_jobs if j['id'] != job_id]
+    store.delete_job(current_user(), job_id)
     return jsonify({'success': True})
 
+def recommendations_key(cv, user_skills):
+    # Changes whenever the CV text or the normalized skill set does
+    skills = '\n'.join(sorted(skill_key(skill) for skill in user_skills))
+    return f"{cv_fingerprint(cv)}:{hashlib.sha256(skills.encode('utf-8')).hexdigest()[:16]}"
+
+def refresh_recommendations(user_id, cv, user_skills, key):
+    # Bypasses the response cache, which would just hand back the previous list
+    response = run_model_call(search_recommended_jobs, cv, user_skills, use_cache=False)
+    recommended_jobs = response.get('recommended_jobs', [])
+    recommended_jobs.sort(key=lambda x: x.get('match_score', 0), reverse=True)
+    cached = {'key': key, 'generated_at': time.time(), 'jobs': recommended_jobs}
+    if recommended_jobs:
+        store.set_state(user_id, recommendations=cached)
+    return cached
+
+# Users with a background refresh in flight, so repeat visits don't queue duplicates
+refreshing_recommendations = set()
+refreshing_recommendations_lock = threading.Lock()
+
+def run_recommendations_refresh(report, user_id, cv, user_skills, key):
+    try:
+        report(10, 'Refreshing job recommendations')
+        refresh_recommendations(user_id, cv, user_skills, key)
+    finally:
+        with refreshing_recommendations_lock:
+            refreshing_recommendations.discard(user_id)
+    return {'message': 'Recommendations refreshed'}
+
+def revalidate_recommendations(user_id, cv, user_skills, key):
+    with refreshing_recommendations_lock:
+        if user_id in refreshing_recommendations:
+            return
+        refreshing_recommendations.add(user_id)
+    task_runner.submit('recommendations', run_recommendations_refresh, user_id, cv, user_skills, key, user_id=user_id)
+
 @app.route('/jobs/recommendations')
 def job_recommendations():
-    if 'cv' not in app_data:
+    # Served from the per-user cache while the CV and skills are unchanged; once
+    # older than RECOMMENDATIONS_TTL the stale list is shown while a task refreshes it
+    user_id = current_user()
+    state = store.get_state(user_id, 'cv', 'recommendations')
+    cv = state.get('cv')
+    if not cv:
         flash('Please generate your base CV first', 'error')
         return redirect(url_for('index'))
     
-    all_skills = set()
-    if 'profile' in app_data and app_data['profile']:
-        try:
-            profile = json.loads(app_data['profile'])
-            all_skills.update(profile.get('skills', []))
-            all_skills.update(profile.get('technical_skills', []))
-            all_skills.update(profile.get('tools', []))
-        except:
-            pass
-    
-    if 'enhancements' in app_data:
-        for enhancement in app_data['enhancements']:
-            try:
-                profile = json.loads(enhancement['profile'])
-                all_skills.update(profile.get('skills', []))
-                all_skills.update(profile.get('technical_skills', []))
-                all_skills.update(profile.get('tools', []))
-            except:
-                pass
-    
-    recommendations_data = search_recommended_jobs(app_data['cv'], list(all_skills))
-    recommended_jobs = recommendations_data.get('recommended_jobs', [])
+    all_skills = normalize_skills(store.load_profile(user_id).get('technical_skills', 'tools', 'skills'))
+    key = recommendations_key(cv, all_skills)
+    cached = state.get('recommendations')
     
-    recommended_jobs.sort(key=lambda x: x.get('match_score', 0), reverse=True)
+    if request.args.get('refresh'):
+        outcome = 'forced'
+    elif not cached or cached['key'] != key:
+        outcome = 'miss'
+    elif time.time() - cached['generated_at'] > app.config['RECOMMENDATIONS_TTL']:
+        outcome = 'stale'
+        revalidate_recommendations(user_id, cv, all_skills, key)
+    else:
+        outcome = 'fresh'
+    metrics.inc('recommendations_cache_total', result=outcome)
+    if outcome in ('forced', 'miss'):
+        cached = refresh_recommendations(user_id, cv, all_skills, key)
     
     return render_template('job_recommendations.html', 
-                         recommended_jobs=recommended_jobs,
-                         user_skills=sorted(list(all_skills)))
+                         recommended_jobs=cached['jobs'],
+                         user_skills=sorted(all_skills, key=str.casefold),
+                         updated=datetime.fromtimestamp(cached['generated_at']).strftime('%Y-%m-%d %H:%M'),
+                         refreshing=outcome == 'stale')
 
 @app.route('/jobs/add-recommended', methods=['POST'])
 def add_recommended_job():
     data = request.get_json()
     
-    job = {
-        'id': len(saved_jobs) + 1,
-        'title': data.get('title'),
-        'company': data.get('company'),
-        'description': data.get('description'),
-        'date_added': datetime.now().strftime('%Y-%m-%d %H:%M'),
-        'applied': False,
-        'match_score': data.get('match_score', 0)
-    }
-    saved_jobs.append(job)
+    store.add_job(current_user(),
+                  title=data.get('title'),
+                  company=data.get('company'),
+                  description=data.get('description'),
+                  match_score=data.get('match_score', 0))
     
     return jsonify({'success': True, 'message': 'Job added to your list!'})
 
@@ -685,79 +3021,162 @@ def delete_skill():
     if not skill_to_remove:
         return jsonify({'success': False, 'message': 'No skill specified'}), 400
     
-    if 'profile' in app_data and app_data['profile']:
-        try:
-            profile = json.loads(app_data['profile'])
-            for key in ['skills', 'technical_skills', 'soft_skills', 'tools', 'methodologies']:
-                if key in profile and skill_to_remove in profile[key]:
-                    profile[key].remove(skill_to_remove)
-            app_data['profile'] = json.dumps(profile)
-        except:
-            pass
+    user_id = current_user()
+    if data.get('async'):
+        task_id = task_runner.submit('skill_delete', run_skill_delete, user_id, skill_to_remove, user_id=user_id)
+        return task_accepted(task_id)
     
-    if 'enhancements' in app_data:
-        for enhancement in app_data['enhancements']:
-            try:
-                profile = json.loads(enhancement['profile'])
-                for key in ['skills', 'technical_skills', 'soft_skills', 'tools', 'methodologies']:
-                    if key in profile and skill_to_remove in profile[key]:
-                        profile[key].remove(skill_to_remove)
-                enhancement['profile'] = json.dumps(profile)
-            except:
-                pass
+    result = run_skill_delete(no_progress, user_id, skill_to_remove)
+    return jsonify({'success': True, 'message': result['message']})
+
+def run_skill_delete(report, user_id, skill_to_remove):
+    report(10, f'Removing {skill_to_remove}')
+    store.update_profile(user_id, lambda profile: profile.discard(skill_to_remove))
     
-    regenerate_enhanced_cv()
+    report(40, 'Updating your CV')
+    regenerate_enhanced_cv(user_id)
     
-    return jsonify({'success': True, 'message': f'Removed {skill_to_remove}'})
+    return {'message': f'Removed {skill_to_remove}', 'redirect': 'dashboard'}
 
 @app.route('/jobs/apply/<int:job_id>')
 def apply_to_job(job_id):
-    if 'cv' not in app_data:
+    user_id = current_user()
+    if not store.has_state(user_id, 'cv'):
         flash('Please generate your base CV first', 'error')
         return redirect(url_for('index'))
     
-    job = next((j for j in saved_jobs if j['id'] == job_id), None)
+    job = store.get_job(user_id, job_id)
     if not job:
         flash('Job not found', 'error')
         return redirect(url_for('jobs_manager'))
     
-    tailored_cv = tailor_cv_to_job(app_data['cv'], job)
-    letter = generate_cover_letter(tailored_cv, job)
-    match_result = analyze_job_match(tailored_cv, job)
+    if request.args.get('stream'):
+        # Content is filled in by /stream/apply/<job_id>
+        return render_template('application.html',
+                             cv='',
+                             cover_letter='',
+                             job_info=job,
+                             match_result={},
+                             stream=True)
     
-    job['applied'] = True
+    if request.args.get('async'):
+        task_id = task_runner.submit('application', run_application_pipeline, user_id, job_id, user_id=user_id)
+        return task_accepted(task_id)
+    
+    run_application_pipeline(no_progress, user_id, job_id)
+    return view_application(job_id)
+
+def run_application_pipeline(report, user_id, job_id):
+    job = store.get_job(user_id, job_id)
+    if not job:
+        raise ValueError('Job not found')
+    
+    report(10, 'Tailoring your CV')
+    tailored_cv = run_model_call(tailor_cv_to_job, store.get_state(user_id, 'cv')['cv'], job)
+    report(60, 'Writing your cover letter and match analysis')
+    letter, match_result = run_parallel(
+        (generate_cover_letter, tailored_cv, job),
+        (analyze_job_match, tailored_cv, job, True, None, store.load_profile(user_id))
+    )
     
-    save_cv_version(tailored_cv, f"Tailored for {job['company']} - {job['title']}")
+    store.update_job(user_id, job_id, applied=True)
+    
+    save_cv_version(user_id, tailored_cv, f"Tailored for {job['company']} - {job['title']}")
+    
+    store.set_state(user_id, application={
+        'job_id': job_id,
+        'cv': tailored_cv,
+        'cover_letter': letter,
+        'match_result': match_result
+    })
+    return {'redirect': 'view_application', 'redirect_args': {'job_id': job_id}}
+
+@app.route('/jobs/application/<int:job_id>')
+def view_application(job_id):
+    user_id = current_user()
+    application = store.get_state(user_id, 'application').get('application')
+    job = store.get_job(user_id, job_id)
+    if not application or application['job_id'] != job_id or not job:
+        return redirect(url_for('apply_to_job', job_id=job_id))
     
     return render_template('application.html',
-                         cv=tailored_cv,
-                         cover_letter=letter,
+                         cv=application['cv'],
+                         cover_letter=application['cover_letter'],
                          job_info=job,
-                         match_result=match_result)
+                         match_result=application['match_result'])
+
+@app.route('/stream/apply/<int:job_id>')
+def stream_application(job_id):
+    user_id = current_user()
+    base_cv = store.get_state(user_id, 'cv').get('cv')
+    if not base_cv:
+        return jsonify({'success': False, 'message': 'Please generate your base CV first'}), 400
+    
+    job = store.get_job(user_id, job_id)
+    if not job:
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    
+    profile = store.load_profile(user_id)
+    
+    def events():
+        try:
+            chunks = []
+            for text in stream_model('tailor_cv_to_job', build_tailor_prompt(base_cv, job)):
+                chunks.append(text)
+                yield sse('cv', text)
+            tailored_cv = ''.join(chunks)
+            
+            store.update_job(user_id, job_id, applied=True)
+            save_cv_version(user_id, tailored_cv, f"Tailored for {job['company']} - {job['title']}")
+            
+            # The match analysis only needs the tailored CV, so it runs while the letter streams
+            match_future = submit_model_call(analyze_job_match, tailored_cv, job, True, None, profile)
+            letter = []
+            for text in stream_model('generate_cover_letter', build_cover_letter_prompt(tailored_cv, job)):
+                letter.append(text)
+                yield sse('letter', text)
+            match_result = match_future.result()
+            yield sse('match', match_result)
+            store.set_state(user_id, application={
+                'job_id': job_id,
+                'cv': tailored_cv,
+                'cover_letter': ''.join(letter),
+                'match_result': match_result
+            })
+        except Exception as e:
+            yield sse('error', str(e))
+            return
+        
+        yield sse('done', {})
+    
+    return sse_response(events())
 
 @app.route('/cv-versions')
 def cv_versions():
-    if 'cv' not in app_data:
+    user_id = current_user()
+    if not store.has_state(user_id, 'cv'):
         return redirect(url_for('index'))
+    state = store.get_state(user_id, 'current_version')
     
-    versions = app_data.get('cv_versions', [])
+    versions = store.list_cv_versions(user_id)
     return render_template('cv_versions.html', 
                          versions=versions,
-                         current_index=app_data.get('current_cv_index', -1))
+                         current_index=state.get('current_version', 0) - 1)
 
 @app.route('/cv-versions/switch/<int:index>')
 def switch_cv_version(index):
-    versions = app_data.get('cv_versions', [])
-    if 0 <= index < len(versions):
-        app_data['current_cv_index'] = index
-        app_data['cv'] = versions[index]['cv']
+    user_id = current_user()
+    version = store.get_cv_version(user_id, index + 1)
+    if version:
+        store.set_state(user_id, cv=version['cv'], current_version=version['version_number'])
         flash(f'Switched to CV version {index + 1}', 'success')
     
     return redirect(url_for('cv_versions'))
 
 @app.route('/cover-letter', methods=['GET', 'POST'])
 def cover_letter():
-    if 'cv' not in app_data:
+    user_id = current_user()
+    if not store.has_state(user_id, 'cv'):
         return redirect(url_for('index'))
     
     if request.method == 'POST':
@@ -767,70 +3186,141 @@ def cover_letter():
             'description': request.form.get('job_description')
         }
         
-        letter = generate_cover_letter(app_data['cv'], job_info)
-        match_result = analyze_job_match(app_data['cv'], job_info)
+        if request.form.get('stream'):
+            # The letter is written by /stream/cover-letter while the page is open
+            store.delete_state(user_id, 'cover_letter', 'match_result')
+            store.set_state(user_id, job_info=job_info)
+            return render_template('cover_letter.html',
+                                 cover_letter='',
+                                 job_info=job_info,
+                                 match_result={},
+                                 stream=True)
+        
+        cv = store.get_state(user_id, 'cv')['cv']
+        letter, match_result = run_parallel(
+            (generate_cover_letter, cv, job_info),
+            (analyze_job_match, cv, job_info, True, None, store.load_profile(user_id))
+        )
         
-        app_data['cover_letter'] = letter
-        app_data['job_info'] = job_info
-        app_data['match_result'] = match_result
+        store.set_state(user_id, cover_letter=letter, job_info=job_info, match_result=match_result)
         
         return render_template('cover_letter.html',
                              cover_letter=letter,
                              job_info=job_info,
                              match_result=match_result)
     
-    if 'cover_letter' in app_data:
+    state = store.get_state(user_id, 'cover_letter', 'job_info', 'match_result')
+    if 'cover_letter' in state:
         return render_template('cover_letter.html',
-                             cover_letter=app_data['cover_letter'],
-                             job_info=app_data['job_info'],
-                             match_result=app_data.get('match_result', {}))
+                             cover_letter=state['cover_letter'],
+                             job_info=state['job_info'],
+                             match_result=state.get('match_result', {}))
     
     return render_template('cover_letter_form.html')
 
+@app.route('/stream/cover-letter')
+def stream_cover_letter():
+    user_id = current_user()
+    state = store.get_state(user_id, 'cv', 'job_info')
+    if 'cv' not in state or 'job_info' not in state:
+        return jsonify({'success': False, 'message': 'No cover letter requested'}), 404
+    
+    cv = state['cv']
+    job_info = state['job_info']
+    profile = store.load_profile(user_id)
+    
+    def events():
+        try:
+            match_future = submit_model_call(analyze_job_match, cv, job_info, True, None, profile)
+            chunks = []
+            for text in stream_model('generate_cover_letter', build_cover_letter_prompt(cv, job_info)):
+                chunks.append(text)
+                yield sse('letter', text)
+            match_result = match_future.result()
+            yield sse('match', match_result)
+        except Exception as e:
+            yield sse('error', str(e))
+            return
+        
+        store.set_state(user_id, cover_letter=''.join(chunks), match_result=match_result)
+        yield sse('done', {})
+    
+    return sse_response(events())
+
 @app.route('/new-cover-letter')
 def new_cover_letter():
-    if 'cover_letter' in app_data:
-        del app_data['cover_letter']
-    if 'job_info' in app_data:
-        del app_data['job_info']
-    if 'match_result' in app_data:
-        del app_data['match_result']
+    store.delete_state(current_user(), 'cover_letter', 'job_info', 'match_result')
     return redirect(url_for('cover_letter'))
 
 @app.route('/reset')
 def reset():
-    app_data.clear()
-    global saved_jobs
-    saved_jobs = []
+    store.reset(current_user())
     return redirect(url_for('index'))
 
+@app.route('/tasks/<task_id>')
+def task_status(task_id):
+    task = task_runner.get(task_id)
+    if not task or task['user_id'] != current_user():
+        return jsonify({'success': False, 'message': 'Task not found'}), 404
+    
+    result = task['result'] or {}
+    if task['status'] == 'done' and result.get('redirect'):
+        task['redirect_url'] = url_for(result['redirect'], **result.get('redirect_args', {}))
+    return jsonify(task)
+
+@app.route('/tasks/stats')
+def task_stats():
+    return jsonify(task_runner.stats())
+
+@app.errorhandler(ModelUnavailable)
+def model_unavailable(error):
+    return jsonify({'success': False, 'message': str(error)}), 503, {'Retry-After': str(int(app.config['CIRCUIT_COOLDOWN']))}
+
+@app.route('/metrics')
+def metrics_endpoint():
+    task_stats = task_runner.stats()
+    metrics.set_gauge('task_queue_depth', task_stats['queue_depth'])
+    metrics.set_gauge('tasks_running', task_stats['running'])
+    cache = llm_cache.snapshot()
+    metrics.set_gauge('llm_cache_entries', cache['entries'])
+    for name, counts in cache['functions'].items():
+        metrics.set_counter('llm_cache_hits_total', counts['hits'], function=name)
+        metrics.set_counter('llm_cache_misses_total', counts['misses'], function=name)
+    for model, breaker in list(circuit_breakers.items()):
+        metrics.set_gauge('llm_circuit_open', 0 if breaker.state() == 'closed' else 1, model=model)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/debug')
 def debug():
     """Debug route to see what data is stored"""
+    user_id = current_user()
+    state = store.get_state(user_id, 'user_info')
+    profile = store.load_profile(user_id).sources.get('base')
     debug_info = {
-        'has_cv': 'cv' in app_data,
-        'has_profile': 'profile' in app_data,
-        'profile_data': app_data.get('profile', 'None'),
-        'enhancements_count': len(app_data.get('enhancements', [])),
-        'cv_versions': len(app_data.get('cv_versions', [])),
-        'user_info': app_data.get('user_info', {})
+        'user_id': user_id,
+        'has_cv': store.has_state(user_id, 'cv'),
+        'has_profile': profile is not None,
+        'profile_data': profile.to_dict() if profile else 'None',
+        'enhancements_count': store.count_enhancements(user_id),
+        'cv_versions': store.count_cv_versions(user_id),
+        'user_info': state.get('user_info', {}),
+        'active_sessions': store.count_users(),
+        'session_memory': store.usage(user_id),
+        'llm_cache': llm_cache.snapshot(),
+        'llm_usage': token_usage.snapshot(),
+        'circuit_breakers': {model: breaker.state() for model, breaker in list(circuit_breakers.items())}
     }
     
-    # Try to parse profile
-    if app_data.get('profile'):
-        try:
-            profile = json.loads(app_data['profile'])
-            debug_info['parsed_profile'] = {
-                'skills_count': len(profile.get('skills', [])),
-                'technical_skills_count': len(profile.get('technical_skills', [])),
-                'tools_count': len(profile.get('tools', [])),
-                'soft_skills_count': len(profile.get('soft_skills', [])),
-                'methodologies_count': len(profile.get('methodologies', [])),
-                'sample_skills': profile.get('skills', [])[:5],
-                'sample_technical': profile.get('technical_skills', [])[:5]
-            }
-        except Exception as e:
-            debug_info['parse_error'] = str(e)
+    if profile:
+        debug_info['parsed_profile'] = {
+            'skills_count': len(profile.skills),
+            'technical_skills_count': len(profile.technical_skills),
+            'tools_count': len(profile.tools),
+            'soft_skills_count': len(profile.soft_skills),
+            'methodologies_count': len(profile.methodologies),
+            'sample_skills': profile.skills[:5],
+            'sample_technical': profile.technical_skills[:5]
+        }
     
     return jsonify(debug_info)
 
@@ -0,0 +1,193 @@
+"""Simulated Anthropic client for the offline benchmarks.
+
+Each call takes a time-to-first-token drawn log-normally around the model's
+median, plus its output tokens at the model's token rate, all multiplied by
+time_scale. Output length is a random share of max_tokens. Responses are canned
+per prompt function, and JSON answers can be made malformed at a given rate.
+A call that would outlive its timeout raises APITimeoutError like the real client,
+and error_rate makes that share of calls fail with a 529 overloaded error.
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+import types
+
+import anthropic
+
+PROFILES = {
+    'claude-opus-4-20250514': {'ttft': 2.5, 'tokens_per_second': 35},
+    'claude-sonnet-4-20250514': {'ttft': 1.2, 'tokens_per_second': 70},
+    'claude-3-5-haiku-20241022': {'ttft': 0.5, 'tokens_per_second': 140}
+}
+
+CV_TEXT = """JANE DOE
+jane@example.com | 07000 000000
+
+PROFESSIONAL SUMMARY
+Computer science student with hands-on Python, SQL and Docker project work.
+
+SKILLS
+- Technical: Python, SQL, Docker, React
+- Soft: Communication, Teamwork
+
+PROJECTS & EXPERIENCE
+- Built a Flask web app used by 200 students
+
+ACHIEVEMENTS
+- Dean's list 2024
+"""
+
+# (text found in the prompt, prompt function, canned response)
+CANNED = [
+    ('Analyze this CV', 'extract_cv_info', json.dumps({
+        "name": "Jane Doe", "email": "jane@example.com", "phone": "07000 000000",
+        "current_role": "Software Engineer", "skills": ["Python", "SQL"],
+        "experience": ["Intern"], "education": ["BSc Computer Science"],
+        "projects": ["Flask app"], "achievements": ["Dean's list"]
+    })),
+    ('presentation/lecture', 'extract_profile', json.dumps({
+        "skills": ["Python", "SQL", "Teamwork"], "projects": ["Group project"],
+        "achievements": ["Top grade"], "tools": ["Git", "Docker"],
+        "expertise_areas": ["Web development"], "technical_skills": ["Python", "React"],
+        "soft_skills": ["Communication"], "methodologies": ["Agile"]
+    })),
+    ('compatibility assessment', 'analyze_job_match', json.dumps({
+        "match_score": 82, "matched_skills": ["Python", "SQL", "Docker"],
+        "missing_skills": ["Kubernetes", "Go"], "matched_experience": ["Flask app"],
+        "key_requirements_met": ["Python"], "gaps": ["Cloud"],
+        "recommendation": "Good fit.",
+        "compatibility_breakdown": {"technical_match": 85, "experience_match": 75,
+                                    "education_match": 90, "soft_skills_match": 80}
+    })),
+    ('recommend relevant job', 'search_recommended_jobs', json.dumps({
+        "recommended_jobs": [
+            {"title": f"Software Engineer {i}", "company": f"Company {i}",
+             "description": "Build Python services.", "match_score": 70 + i,
+             "key_skills": ["Python"], "reason": "Python overlap"}
+            for i in range(8)
+        ]
+    })),
+    ('cover letter', 'generate_cover_letter', "Opening hook.\n\nRelevant projects.\n\nClosing call to action.")
+]
+
+def prompt_text(content):
+    if isinstance(content, list):
+        return ''.join(block.get('text', '') for block in content)
+    return content
+
+def classify(prompt):
+    for marker, name, response in CANNED:
+        if marker in prompt:
+            return name, response
+    return 'generate_cv', CV_TEXT
+
+def overloaded_error():
+    response = types.SimpleNamespace(status_code=529, headers={}, request=None)
+    return anthropic.APIStatusError('Overloaded', response=response,
+                                    body={'type': 'error', 'error': {'type': 'overloaded_error'}})
+
+def scale_delays(cv_app, time_scale):
+    # Retry backoff, breaker cooldown and hedge delays are real seconds in the app,
+    # so shrink them the same way the simulated latencies are
+    for key in ('LLM_RETRY_BASE_DELAY', 'LLM_RETRY_MAX_DELAY', 'CIRCUIT_COOLDOWN'):
+        cv_app.app.config[key] *= time_scale
+    for route in cv_app.app.config['MODEL_ROUTES'].values():
+        if route.get('hedge_after'):
+            route['hedge_after'] *= time_scale
+
+class FakeMessages:
+    def __init__(self, profiles=None, sigma=0.4, time_scale=0.01, malformed_rate=0.0, error_rate=0.0, seed=0):
+        self.profiles = profiles or PROFILES
+        self.sigma = sigma
+        self.time_scale = time_scale
+        self.malformed_rate = malformed_rate
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = []
+
+    def plan(self, model, max_tokens, messages, timeout):
+        # Returns (text, output_tokens, ttft, total, timed_out) in real seconds
+        name, text = classify(prompt_text(messages[0]['content']))
+        profile = self.profiles[model]
+        with self.lock:
+            ttft = profile['ttft'] * self.rng.lognormvariate(0, self.sigma)
+            output_tokens = int(max_tokens * self.rng.uniform(0.3, 0.9))
+            malformed = text.startswith('{') and self.rng.random() < self.malformed_rate
+            overloaded = self.rng.random() < self.error_rate
+            self.calls.append((name, model))
+        if overloaded:
+            raise overloaded_error()
+        total = ttft
+        if profile.get('tokens_per_second'):
+            total += output_tokens / profile['tokens_per_second']
+        if malformed:
+            text = text[:len(text) // 2]
+        timed_out = timeout is not None and total > timeout
+        if timed_out:
+            total = timeout
+        return text, output_tokens, ttft * self.time_scale, total * self.time_scale, timed_out
+
+    @staticmethod
+    def message(model, text, output_tokens):
+        usage = types.SimpleNamespace(input_tokens=1200, output_tokens=output_tokens,
+                                      cache_creation_input_tokens=0, cache_read_input_tokens=0)
+        return types.SimpleNamespace(model=model, usage=usage, stop_reason='end_turn',
+                                     content=[types.SimpleNamespace(type='text', text=text)])
+
+    def create(self, model, max_tokens, messages, timeout=None, **kwargs):
+        text, output_tokens, ttft, total, timed_out = self.plan(model, max_tokens, messages, timeout)
+        time.sleep(total)
+        if timed_out:
+            raise anthropic.APITimeoutError(request=None)
+        return self.message(model, text, output_tokens)
+
+    def stream(self, model, max_tokens, messages, timeout=None, **kwargs):
+        return FakeStream(self, *self.plan(model, max_tokens, messages, timeout), model)
+
+class FakeStream:
+    def __init__(self, messages, text, output_tokens, ttft, total, timed_out, model):
+        self.messages = messages
+        self.text = text
+        self.output_tokens = output_tokens
+        self.ttft = ttft
+        self.total = total
+        self.timed_out = timed_out
+        self.model = model
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    @property
+    def text_stream(self):
+        if self.timed_out:
+            time.sleep(self.total)
+            raise anthropic.APITimeoutError(request=None)
+        time.sleep(self.ttft)
+        pieces = [self.text[i:i + 40] for i in range(0, len(self.text), 40)] or ['']
+        for piece in pieces:
+            yield piece
+            time.sleep((self.total - self.ttft) / len(pieces))
+
+    def get_final_message(self):
+        return FakeMessages.message(self.model, self.text, self.output_tokens)
+
+class FakeAsyncMessages(FakeMessages):
+    async def create(self, model, max_tokens, messages, timeout=None, **kwargs):
+        text, output_tokens, ttft, total, timed_out = self.plan(model, max_tokens, messages, timeout)
+        await asyncio.sleep(total)
+        if timed_out:
+            raise anthropic.APITimeoutError(request=None)
+        return self.message(model, text, output_tokens)
+
+class FakeAnthropic:
+    def __init__(self, messages):
+        self.messages = messages
+
+    def with_options(self, **options):
+        return self
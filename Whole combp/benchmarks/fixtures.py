@@ -0,0 +1,73 @@
+"""Generated lecture-style documents for the benchmarks.
+
+PDFs are written by hand (one Helvetica text block per page) so no extra
+PDF library is needed; PPTX files use python-pptx like the app itself.
+"""
+import random
+from pptx import Presentation
+
+TOPICS = [
+    'Python', 'Java', 'SQL', 'Docker', 'Kubernetes', 'React', 'TypeScript',
+    'Machine Learning', 'Linear Regression', 'Agile', 'Scrum', 'Git', 'AWS',
+    'Data Structures', 'Algorithms', 'REST APIs', 'Unit Testing', 'CI/CD',
+    'Teamwork', 'Communication', 'Pandas', 'NumPy', 'Linux', 'Networking'
+]
+
+def lecture_lines(page, count, rng):
+    lines = [f'Lecture {page + 1}: {rng.choice(TOPICS)} in practice']
+    for _ in range(count - 1):
+        lines.append(f'- Students apply {rng.choice(TOPICS)} and {rng.choice(TOPICS)} to a group project')
+    return lines
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+def make_pdf(path, pages=200, lines_per_page=30, seed=0):
+    rng = random.Random(seed)
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        None,  # page tree, filled in once the page object numbers are known
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>'
+    ]
+    page_ids = []
+    for page in range(pages):
+        text = ['BT /F1 10 Tf 12 TL 40 800 Td']
+        for line in lecture_lines(page, lines_per_page, rng):
+            text.append(f'({_escape(line)}) Tj T*')
+        text.append('ET')
+        stream = '\n'.join(text).encode('latin-1')
+        objects.append(b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream')
+        content_id = len(objects)
+        objects.append(
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+            b'/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>' % content_id
+        )
+        page_ids.append(len(objects))
+    kids = ' '.join(f'{page_id} 0 R' for page_id in page_ids).encode()
+    objects[1] = b'<< /Type /Pages /Kids [' + kids + b'] /Count %d >>' % pages
+
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b'%d 0 obj\n' % number + body + b'\nendobj\n'
+    xref = len(out)
+    out += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    for offset in offsets:
+        out += b'%010d 00000 n \n' % offset
+    out += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    with open(path, 'wb') as f:
+        f.write(out)
+    return path
+
+def make_pptx(path, slides=200, bullets_per_slide=8, seed=0):
+    rng = random.Random(seed)
+    prs = Presentation()
+    layout = prs.slide_layouts[1]
+    for index in range(slides):
+        slide = prs.slides.add_slide(layout)
+        title, *bullets = lecture_lines(index, bullets_per_slide + 1, rng)
+        slide.shapes.title.text = title
+        slide.placeholders[1].text = '\n'.join(bullet.lstrip('- ') for bullet in bullets)
+    prs.save(path)
+    return path
@@ -0,0 +1,194 @@
+"""Drive the main user flows under concurrent load against a simulated model backend.
+
+    python benchmarks/load_bench.py --users 8 --iterations 2
+    python benchmarks/load_bench.py --save-baseline
+    python benchmarks/load_bench.py --check-baseline --tolerance 0.25
+
+Each virtual user has its own session and walks through /upload,
+/enhance-profile/upload, /skills/delete, /jobs/recommendations and
+/jobs/apply with generated PDF/PPTX fixtures. No API calls are made: the
+model client is replaced with fake_anthropic. Per-route p50/p95/p99 and
+requests per second are printed, and can be saved as a baseline or checked
+against one (exit status 1 on a regression).
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fake_anthropic import FakeAnthropic, FakeAsyncMessages, FakeMessages, scale_delays
+from fixtures import make_pdf, make_pptx
+
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baselines', 'load.json')
+# Options that change the numbers; a baseline is only comparable when they match
+COMPARABLE = ('users', 'iterations', 'pages', 'time_scale', 'malformed_rate', 'error_rate', 'serving_mode',
+              'llm_cache')
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+class Recorder:
+    def __init__(self):
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def request(self, route, send, expect=(200, 302)):
+        started = time.perf_counter()
+        response = send()
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.timings[route].append(elapsed)
+            if response.status_code not in expect:
+                self.errors[route] += 1
+        return response
+
+def run_user(cv_app, recorder, user, args, fixture_dir):
+    client = cv_app.app.test_client()
+    for iteration in range(args.iterations):
+        seed = user * 1000 + iteration
+        cv_path = make_pdf(os.path.join(fixture_dir, f'cv_{seed}.pdf'), pages=2, seed=seed)
+        slides_path = make_pptx(os.path.join(fixture_dir, f'slides_{seed}.pptx'), slides=args.pages, seed=seed)
+        notes_path = make_pdf(os.path.join(fixture_dir, f'notes_{seed}.pdf'), pages=args.pages, seed=seed + 1)
+
+        with open(cv_path, 'rb') as cv_file, open(slides_path, 'rb') as slides_file:
+            recorder.request('/upload', lambda: client.post('/upload', data={
+                'name': f'User {user}', 'email': '', 'phone': '', 'target_role': '',
+                'cv_file': (cv_file, 'cv.pdf'), 'slides_file': (slides_file, 'slides.pptx')
+            }, content_type='multipart/form-data'))
+
+        with open(notes_path, 'rb') as notes_file:
+            recorder.request('/enhance-profile/upload', lambda: client.post('/enhance-profile/upload', data={
+                'file': (notes_file, 'notes.pdf')
+            }, content_type='multipart/form-data'))
+
+        recorder.request('/skills/delete', lambda: client.post('/skills/delete', json={'skill': 'Teamwork'}))
+        recorder.request('/jobs/recommendations', lambda: client.get('/jobs/recommendations'))
+
+        client.post('/jobs/add', data={
+            'job_title': f'Backend Engineer {seed}', 'company': 'Acme',
+            'job_description': 'Python, SQL and Docker services on AWS. Agile team.'
+        })
+        with client.session_transaction() as session:
+            user_id = session['user_id']
+        job_id = cv_app.store.list_jobs(user_id)[-1]['id']
+        recorder.request('/jobs/apply', lambda: client.get(f'/jobs/apply/{job_id}'))
+
+def summarize(recorder, wall_seconds):
+    routes = {}
+    for route, timings in sorted(recorder.timings.items()):
+        routes[route] = {
+            'count': len(timings),
+            'errors': recorder.errors[route],
+            'p50': round(percentile(timings, 0.50), 4),
+            'p95': round(percentile(timings, 0.95), 4),
+            'p99': round(percentile(timings, 0.99), 4),
+            'rps': round(len(timings) / wall_seconds, 2)
+        }
+    total = sum(len(timings) for timings in recorder.timings.values())
+    return {'routes': routes, 'total_requests': total, 'rps': round(total / wall_seconds, 2),
+            'wall_seconds': round(wall_seconds, 2)}
+
+def check_baseline(summary, baseline, options, tolerance):
+    mismatched = [key for key in COMPARABLE if baseline['options'].get(key) != options[key]]
+    if mismatched:
+        print(f'baseline was recorded with different options ({", ".join(mismatched)}); not comparing')
+        return None
+    ok = True
+    for route, stats in summary['routes'].items():
+        expected = baseline['routes'].get(route)
+        if not expected:
+            continue
+        if stats['p95'] > expected['p95'] * (1 + tolerance):
+            print(f'REGRESSION {route}: p95 {stats["p95"]:.3f}s vs baseline {expected["p95"]:.3f}s')
+            ok = False
+        if stats['errors'] > expected['errors']:
+            print(f'REGRESSION {route}: {stats["errors"]} errors vs baseline {expected["errors"]}')
+            ok = False
+    if summary['rps'] < baseline['rps'] * (1 - tolerance):
+        print(f'REGRESSION throughput: {summary["rps"]} req/s vs baseline {baseline["rps"]} req/s')
+        ok = False
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=8, help='concurrent virtual users')
+    parser.add_argument('--iterations', type=int, default=2, help='flows per user')
+    parser.add_argument('--pages', type=int, default=20, help='pages per slide deck / notes PDF')
+    parser.add_argument('--time-scale', type=float, default=0.01, help='real seconds per simulated second')
+    parser.add_argument('--malformed-rate', type=float, default=0.05, help='share of JSON answers that are cut off')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of model calls that fail as overloaded')
+    parser.add_argument('--serving-mode', choices=['sync', 'async'], default='sync')
+    parser.add_argument('--llm-cache', action='store_true',
+                        help='keep the response cache on (off by default, since canned answers repeat)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--check-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative regression')
+    args = parser.parse_args()
+
+    args.baseline = os.path.abspath(args.baseline)
+    workdir = tempfile.mkdtemp(prefix='cv_load_')
+    os.environ['DATABASE'] = os.path.join(workdir, 'load.db')
+    os.environ['SERVING_MODE'] = args.serving_mode
+    os.chdir(workdir)  # uploads/ is relative to the working directory
+    import app as cv_app
+
+    messages = FakeMessages(sigma=0.4, time_scale=args.time_scale, malformed_rate=args.malformed_rate,
+                            error_rate=args.error_rate, seed=args.seed)
+    cv_app.client = FakeAnthropic(messages)
+    async_messages = FakeAsyncMessages(sigma=0.4, time_scale=args.time_scale, malformed_rate=args.malformed_rate,
+                                       error_rate=args.error_rate, seed=args.seed)
+    cv_app.async_client = FakeAnthropic(async_messages)
+    scale_delays(cv_app, args.time_scale)
+    cv_app.app.config['MATCH_MODE'] = 'llm'
+    if not args.llm_cache:
+        cv_app.llm_cache = cv_app.LLMCache(max_entries=0)
+
+    recorder = Recorder()
+    fixture_dir = os.path.join(workdir, 'fixtures')
+    os.makedirs(fixture_dir)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        for future in [pool.submit(run_user, cv_app, recorder, user, args, fixture_dir)
+                       for user in range(args.users)]:
+            future.result()
+    summary = summarize(recorder, time.perf_counter() - started)
+    os.chdir(BENCH_DIR)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f'{"route":<26}{"count":>7}{"errors":>8}{"p50 s":>9}{"p95 s":>9}{"p99 s":>9}{"req/s":>8}')
+    for route, stats in summary['routes'].items():
+        print(f'{route:<26}{stats["count"]:>7}{stats["errors"]:>8}{stats["p50"]:>9.3f}'
+              f'{stats["p95"]:>9.3f}{stats["p99"]:>9.3f}{stats["rps"]:>8.2f}')
+    print(f'{summary["total_requests"]} requests in {summary["wall_seconds"]}s, {summary["rps"]} req/s, '
+          f'{len(messages.calls) + len(async_messages.calls)} model calls')
+
+    options = {key: getattr(args, key) for key in COMPARABLE}
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(dict(summary, options=options), f, indent=2)
+        print(f'baseline written to {args.baseline}')
+    if args.check_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        ok = check_baseline(summary, baseline, options, args.tolerance)
+        if ok is False:
+            sys.exit(1)
+        if ok:
+            print('no regressions against baseline')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Compare serial and page-parallel document parsing.
+
+    python benchmarks/parse_bench.py --pages 300 --workers 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as cv_app
+from fixtures import make_pdf, make_pptx
+
+def best_of(runs, fn, *args):
+    timings = []
+    result = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = fn(*args)
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=300)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        documents = [
+            make_pdf(os.path.join(tmp, 'lectures.pdf'), pages=args.pages),
+            make_pptx(os.path.join(tmp, 'lectures.pptx'), slides=args.pages)
+        ]
+        print(f'{"file":<16}{"pages":>7}{"serial s":>11}{"parallel s":>12}{"speedup":>9}')
+        for path in documents:
+            cv_app.app.config['PARSE_WORKERS'] = 1
+            serial, serial_text = best_of(args.runs, cv_app.parse_document, path)
+
+            cv_app.app.config['PARSE_WORKERS'] = args.workers
+            cv_app.app.config['PARSE_PARALLEL_MIN_PAGES'] = 1
+            cv_app.parse_document(path)  # start the pool outside the timed runs
+            parallel, parallel_text = best_of(args.runs, cv_app.parse_document, path)
+
+            assert serial_text == parallel_text, 'parallel output differs from serial output'
+            print(f'{os.path.basename(path):<16}{args.pages:>7}{serial:>11.2f}{parallel:>12.2f}{serial / parallel:>8.1f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Compare model routes per prompt function against a simulated backend.
+
+    python benchmarks/route_bench.py --calls 200
+    python benchmarks/route_bench.py --latency claude-3-5-haiku-20241022=1.5 --time-scale 0.01
+
+No API calls are made. Each model answers after a log-normal delay around the
+median given by --latency (seconds, scaled by --time-scale), and a request that
+outlives its timeout raises APITimeoutError like the real client, so latency
+budgets and fallbacks behave as they would in production. --error-rate makes a
+share of calls fail as overloaded, to see how retries and hedging hold up.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import anthropic
+import app as cv_app
+from fake_anthropic import FakeAnthropic, FakeMessages, scale_delays
+
+MEDIAN_LATENCY = {
+    cv_app.LARGE_MODEL: 14.0,
+    cv_app.BALANCED_MODEL: 6.0,
+    cv_app.FAST_MODEL: 2.0
+}
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def run_route(name, route, args):
+    # Whole-call latency only, no per-token component
+    profiles = {model: {'ttft': seconds} for model, seconds in args.latencies.items()}
+    messages = FakeMessages(profiles, args.sigma, args.time_scale, error_rate=args.error_rate, seed=args.seed)
+    cv_app.client = FakeAnthropic(messages)
+    cv_app.app.config['MODEL_ROUTES'] = {name: route}
+    cv_app.circuit_breakers.clear()
+
+    def timed_call(_):
+        started = time.perf_counter()
+        try:
+            cv_app.call_model(name, 'benchmark prompt', use_cache=False)
+            failed = False
+        except (anthropic.APIError, cv_app.ModelUnavailable):
+            failed = True
+        return (time.perf_counter() - started) / args.time_scale, failed
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(timed_call, range(args.calls)))
+    timings = [timing for timing, failed in results]
+    failures = sum(failed for timing, failed in results)
+    fallbacks = sum(1 for function, model in messages.calls if model != route['model'])
+    return percentile(timings, 0.5), percentile(timings, 0.95), fallbacks, failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--latency', action='append', default=[], metavar='MODEL=SECONDS',
+                        help='median latency for a model')
+    parser.add_argument('--sigma', type=float, default=0.5, help='log-normal spread of latencies')
+    parser.add_argument('--time-scale', type=float, default=0.005, help='real seconds per simulated second')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of calls that fail as overloaded')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    args.latencies = dict(MEDIAN_LATENCY)
+    for item in args.latency:
+        model, seconds = item.split('=')
+        args.latencies[model] = float(seconds)
+
+    scale_delays(cv_app, args.time_scale)
+    routes = dict(cv_app.app.config['MODEL_ROUTES'])
+    baseline = {**cv_app.DEFAULT_ROUTE, 'model': cv_app.LARGE_MODEL}
+
+    print(f'{"function":<26}{"route":<10}{"model":<28}{"p50 s":>8}{"p95 s":>8}{"fallbacks":>11}{"failed":>8}')
+    for name, overrides in routes.items():
+        routed = {**cv_app.DEFAULT_ROUTE, **overrides}
+        for label, route in (('baseline', {**baseline, 'timeout': routed['timeout']}), ('routed', routed)):
+            p50, p95, fallbacks, failures = run_route(name, route, args)
+            print(f'{name:<26}{label:<10}{route["model"]:<28}{p50:>8.1f}{p95:>8.1f}{fallbacks:>11}{failures:>8}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+// Background tasks: a POST answers 202 with a status_url, which is polled
+// until the task has finished. Shared by every page that starts one.
+function pollTask(statusUrl, onProgress) {
+    return new Promise((resolve, reject) => {
+        const check = () => {
+            fetch(statusUrl)
+                .then(response => response.json())
+                .then(task => {
+                    if (task.status === 'done') return resolve(task);
+                    if (task.status === 'failed' || task.success === false) {
+                        return reject(new Error(task.error || task.message));
+                    }
+                    if (onProgress) onProgress(task);
+                    setTimeout(check, 1000);
+                })
+                .catch(reject);
+        };
+        check();
+    });
+}
+
+// Resolves with the finished task. Form posts that fail validation come back
+// as a redirect with a flash message; the page follows it and the promise
+// never settles. JSON endpoints reject with the server's message instead.
+function startTask(url, options, onProgress) {
+    return fetch(url, Object.assign({ method: 'POST' }, options))
+        .then(response => {
+            if (response.status === 202) {
+                return response.json().then(data => pollTask(data.status_url, onProgress));
+            }
+            if (response.redirected) {
+                window.location = response.url;
+                return new Promise(() => {});
+            }
+            return response.json().then(data => { throw new Error(data.message); });
+        });
+}